@@ -0,0 +1,178 @@
+import argparse
+import cProfile
+import io
+import json
+import os
+import platform
+import pstats
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from final_draft import (load_data, build_cache, moving_average_crossover, backtest_strategy,
+                         calculate_sharpe_ratio, calculate_trade_statistics)
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000, 1_000_000, 10_000_000]
+
+def synthetic_prices(n_bars, seed=0, start_price=10000.0, drift=0.05, volatility=0.8,
+                     freq='1min'):
+    # Geometric Brownian motion closes with plausible OHLCV around them
+    rng = np.random.default_rng(seed)
+    dt = pd.Timedelta(freq) / pd.Timedelta(days=365)
+    shocks = rng.standard_normal(n_bars)
+    log_returns = (drift - 0.5 * volatility**2) * dt + volatility * np.sqrt(dt) * shocks
+    close = start_price * np.exp(np.cumsum(log_returns))
+    open_ = np.concatenate(([start_price], close[:-1]))
+    spread = np.abs(rng.standard_normal(n_bars)) * volatility * np.sqrt(dt)
+    return pd.DataFrame({
+        'datetime': pd.date_range('2019-01-01', periods=n_bars, freq=freq),
+        'open': open_,
+        'high': np.maximum(open_, close) * (1 + spread),
+        'low': np.minimum(open_, close) * (1 - spread),
+        'close': close,
+        'volume': rng.lognormal(3, 1, n_bars)
+    })
+
+def pipeline_stages(file_path, short_window, long_window):
+    # Each stage takes the previous stage's output, mirroring the __main__ flow of final_draft
+    return [
+        ('load_data', lambda _: load_data(file_path)),
+        ('build_cache', lambda data: (build_cache(file_path), data)[1]),
+        ('load_data_cached', lambda _: load_data(file_path, use_cache=True)),
+        ('moving_average_crossover',
+         lambda data: moving_average_crossover(data, short_window, long_window, os.devnull)),
+        ('backtest_strategy', backtest_strategy),
+        ('calculate_sharpe_ratio', lambda data: (calculate_sharpe_ratio(data), data)[1]),
+        ('calculate_trade_statistics', lambda data: (calculate_trade_statistics(data), data)[1]),
+    ]
+
+def time_pipeline(stages):
+    timings = {}
+    result = None
+    for name, stage in stages:
+        started = time.perf_counter()
+        result = stage(result)
+        timings[name] = time.perf_counter() - started
+    return timings
+
+def trace_pipeline(stages):
+    # Separate pass so tracemalloc's bookkeeping does not distort the wall times
+    peaks = {}
+    result = None
+    tracemalloc.start()
+    try:
+        for name, stage in stages:
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+            result = stage(result)
+            peaks[name] = tracemalloc.get_traced_memory()[1] - baseline
+    finally:
+        tracemalloc.stop()
+    return peaks
+
+def profile_pipeline(stages, top=10):
+    report = {}
+    result = None
+    for name, stage in stages:
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        profiler.enable()
+        result = stage(result)
+        profiler.disable()
+        elapsed = time.perf_counter() - started
+
+        stats = pstats.Stats(profiler, stream=io.StringIO())
+        stats.sort_stats('cumulative')
+        hottest = []
+        for (file_name, line, function), (_, calls, total, cumulative, _) in \
+                sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:top]:
+            hottest.append({'function': f"{os.path.basename(file_name)}:{line}({function})",
+                            'calls': calls, 'tottime': total, 'cumtime': cumulative})
+        report[name] = {'seconds': elapsed, 'hottest': hottest}
+    return report
+
+def run_benchmark(sizes, repeat=3, short_window=5, long_window=50, profile=False, seed=0):
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        for n_bars in sizes:
+            file_path = os.path.join(work_dir, f"gbm_{n_bars}.csv")
+            synthetic_prices(n_bars, seed=seed).to_csv(file_path)
+            stages = pipeline_stages(file_path, short_window, long_window)
+
+            runs = [time_pipeline(stages) for _ in range(repeat)]
+            entry = {'bars': n_bars, 'stages': {}}
+            peaks = trace_pipeline(stages)
+            for name, _ in stages:
+                seconds = [run[name] for run in runs]
+                entry['stages'][name] = {'seconds': seconds, 'median': float(np.median(seconds)),
+                                         'min': min(seconds), 'peak_bytes': peaks[name]}
+            entry['total_seconds'] = sum(stage['median'] for stage in entry['stages'].values())
+            entry['peak_bytes'] = max(peaks.values())
+            if profile:
+                entry['profile'] = profile_pipeline(stages)
+            results.append(entry)
+            print(f"{n_bars:>10} bars: {entry['total_seconds']:.3f}s total, "
+                  f"peak {entry['peak_bytes'] / 2**20:.1f} MiB", file=sys.stderr)
+    return results
+
+def environment_info():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ''
+    return {'commit': commit, 'python': platform.python_version(), 'numpy': np.__version__,
+            'pandas': pd.__version__, 'platform': platform.platform(),
+            'cpu_count': os.cpu_count()}
+
+def compare(results, baseline):
+    # Prints median-time ratios against an earlier JSON report (>1 means slower now)
+    previous = {entry['bars']: entry for entry in baseline['results']}
+    for entry in results:
+        old = previous.get(entry['bars'])
+        if old is None:
+            continue
+        for name, stage in entry['stages'].items():
+            if name in old['stages'] and old['stages'][name]['median'] > 0:
+                ratio = stage['median'] / old['stages'][name]['median']
+                print(f"{entry['bars']:>10} {name:<28} {ratio:6.2f}x")
+
+def print_profile(results):
+    for entry in results:
+        print(f"Hottest stages at {entry['bars']} bars:")
+        ranked = sorted(entry['profile'].items(), key=lambda item: item[1]['seconds'], reverse=True)
+        for name, report in ranked:
+            print(f"  {name:<28} {report['seconds']:.4f}s")
+            for row in report['hottest'][:3]:
+                print(f"      {row['cumtime']:.4f}s  {row['function']}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the BTC backtesting pipeline")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--short-window', type=int, default=5)
+    parser.add_argument('--long-window', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--profile', action='store_true', help="add a cProfile pass per size")
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--compare', help="earlier JSON report to diff against")
+    args = parser.parse_args(argv)
+
+    results = run_benchmark(args.sizes, args.repeat, args.short_window, args.long_window,
+                            args.profile, args.seed)
+    with open(args.output, 'w') as output:
+        json.dump({'environment': environment_info(), 'results': results}, output, indent=2)
+
+    if args.profile:
+        print_profile(results)
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            compare(results, json.load(baseline_file))
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,240 @@
 import pandas as pd
 import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 import numpy as np
+import os
+import csv
+import hashlib
+import json
+import math
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from indicators import compute_indicators
 
-def load_data(file_path):
-    data = pd.read_csv(file_path)
+PRICE_COLUMNS = ['open', 'high', 'low', 'close', 'volume']
+
+def load_data(file_path, start=None, end=None, use_cache=False, timeframe=None):
+    # use_cache / timeframe return a frame backed by the read-only memory-mapped cache (zero copy):
+    # adding columns works, but assigning into the price columns raises; use .copy() for that.
+    # Files without the full OHLCV set are always read straight from the CSV.
+    if timeframe or (use_cache and _has_price_columns(file_path)):
+        columns = (load_timeframe(file_path, timeframe, start, end) if timeframe
+                   else load_columns(file_path, start, end))
+        # copy=False keeps the memory-mapped columns as the frame's backing arrays
+        return pd.DataFrame({name: columns[name] for name in PRICE_COLUMNS},
+                            index=pd.DatetimeIndex(columns['datetime'].view('datetime64[ns]'),
+                                                   name='datetime'), copy=False)
+
+    # The leading unnamed column is just a saved RangeIndex
+    data = pd.read_csv(file_path, usecols=lambda column: not column.startswith('Unnamed'))
     data['datetime'] = pd.to_datetime(data['datetime'])
     data.set_index('datetime', inplace=True)
-    return data
+    return data.loc[start:end] if start is not None or end is not None else data
+
+def _has_price_columns(file_path):
+    with open(file_path, newline='') as source:
+        header = next(csv.reader(source), [])
+    return all(name in header for name in PRICE_COLUMNS)
+
+def _cache_dir(file_path):
+    return f"{file_path}.cache"
+
+def _file_sha256(file_path, block_size=2**20):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as source:
+        for block in iter(lambda: source.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _read_cache_meta(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, 'meta.json')) as meta_file:
+            return json.load(meta_file)
+    except (OSError, ValueError):
+        return None
+
+def _write_cache_meta(cache_dir, meta):
+    meta_path = os.path.join(cache_dir, 'meta.json')
+    with open(meta_path + '.tmp', 'w') as meta_file:
+        json.dump(meta, meta_file)
+    os.replace(meta_path + '.tmp', meta_path)
+
+def _cache_is_current(file_path, cache_dir):
+    meta = _read_cache_meta(cache_dir)
+    if meta is None:
+        return False
+    stat = os.stat(file_path)
+    if meta['mtime_ns'] == stat.st_mtime_ns and meta['size'] == stat.st_size:
+        return True
+    # A touched but unchanged file only costs one hash pass, not a rebuild
+    if meta['size'] == stat.st_size and meta['sha256'] == _file_sha256(file_path):
+        meta['mtime_ns'] = stat.st_mtime_ns
+        _write_cache_meta(cache_dir, meta)
+        return True
+    return False
+
+def build_cache(file_path, cache_dir=None, chunk_size=1_000_000):
+    # One pass over the CSV in chunks, appending each column to its own raw int64/float64 file
+    cache_dir = cache_dir or _cache_dir(file_path)
+    os.makedirs(cache_dir, exist_ok=True)
+    meta_path = os.path.join(cache_dir, 'meta.json')
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+
+    stat = os.stat(file_path)
+    rows = 0
+    outputs = {name: open(os.path.join(cache_dir, f"{name}.bin"), 'wb')
+               for name in ['datetime'] + PRICE_COLUMNS}
+    try:
+        for chunk in pd.read_csv(file_path, usecols=['datetime'] + PRICE_COLUMNS,
+                                 chunksize=chunk_size):
+            timestamps = pd.to_datetime(chunk['datetime']).to_numpy(dtype='datetime64[ns]')
+            timestamps.view(np.int64).tofile(outputs['datetime'])
+            for name in PRICE_COLUMNS:
+                chunk[name].to_numpy(dtype=np.float64).tofile(outputs[name])
+            rows += len(chunk)
+    finally:
+        for output in outputs.values():
+            output.close()
+
+    _write_cache_meta(cache_dir, {'rows': rows, 'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size,
+                                  'sha256': _file_sha256(file_path)})
+    return cache_dir
+
+def load_columns(file_path, start=None, end=None, cache_dir=None):
+    # Read-only memory-mapped views of the cached columns; start/end (inclusive) are resolved
+    # with a binary search on the int64 epoch-nanosecond timestamps, so nothing outside the
+    # range is read
+    cache_dir = cache_dir or _cache_dir(file_path)
+    if not _cache_is_current(file_path, cache_dir):
+        build_cache(file_path, cache_dir)
+    return _slice_columns(_map_columns(cache_dir), start, end)
+
+def _map_columns(cache_dir):
+    rows = _read_cache_meta(cache_dir)['rows']
+    columns = {'datetime': np.memmap(os.path.join(cache_dir, 'datetime.bin'), dtype=np.int64,
+                                     mode='r', shape=(rows,)) if rows else np.empty(0, np.int64)}
+    for name in PRICE_COLUMNS:
+        columns[name] = (np.memmap(os.path.join(cache_dir, f"{name}.bin"), dtype=np.float64,
+                                   mode='r', shape=(rows,)) if rows else np.empty(0))
+    return columns
+
+def _slice_columns(columns, start=None, end=None):
+    timestamps = columns['datetime']
+    first = 0 if start is None else np.searchsorted(timestamps, pd.Timestamp(start).value, 'left')
+    last = len(timestamps) if end is None else np.searchsorted(timestamps, pd.Timestamp(end).value, 'right')
+    return {name: values[first:last] for name, values in columns.items()}
+
+def iter_column_chunks(file_path, chunk_size=1_000_000, start=None, end=None):
+    columns = load_columns(file_path, start, end)
+    for offset in range(0, len(columns['datetime']), chunk_size):
+        yield {name: values[offset:offset + chunk_size] for name, values in columns.items()}
+
+# Timeframe name -> bucket width in nanoseconds. Buckets are left-closed and labelled by their
+# start; weeks start on Monday like the bundled weekly bars
+TIMEFRAMES = {
+    '1m': 60 * 10**9,
+    '5m': 5 * 60 * 10**9,
+    '1h': 3600 * 10**9,
+    '1d': 86400 * 10**9,
+    '1w': 7 * 86400 * 10**9,
+}
+_WEEK_ORIGIN = 4 * 86400 * 10**9  # 1970-01-05, the first Monday after the epoch
+SECONDS_PER_YEAR = 365.25 * 86400
+
+def resample_columns(columns, timeframe):
+    # OHLCV aggregation on sorted raw columns: bucket starts come from integer flooring and
+    # every field is a single reduceat over the bucket boundaries (no groupby)
+    width = TIMEFRAMES[timeframe]
+    origin = _WEEK_ORIGIN if timeframe == '1w' else 0
+    timestamps = np.asarray(columns['datetime'])
+    buckets = (timestamps - origin) // width * width + origin
+    if not len(buckets):
+        return {name: np.asarray(values)[:0] for name, values in columns.items()}
+    starts = np.concatenate(([0], np.flatnonzero(buckets[1:] != buckets[:-1]) + 1))
+    ends = np.concatenate((starts[1:], [len(buckets)]))
+    return {
+        'datetime': buckets[starts],
+        'open': np.asarray(columns['open'])[starts],
+        'high': np.maximum.reduceat(columns['high'], starts),
+        'low': np.minimum.reduceat(columns['low'], starts),
+        'close': np.asarray(columns['close'])[ends - 1],
+        'volume': np.add.reduceat(columns['volume'], starts)
+    }
+
+def _bar_width(timestamps):
+    return int(np.median(np.diff(timestamps[:100_001]))) if len(timestamps) > 1 else 0
+
+def _check_timeframe(file_path, timeframe, base_width):
+    # Bars can only be aggregated into coarser ones, never split into finer ones
+    if timeframe not in TIMEFRAMES:
+        raise ValueError(f"Unknown timeframe '{timeframe}', choose from {list(TIMEFRAMES)}")
+    if TIMEFRAMES[timeframe] < base_width:
+        raise ValueError(f"{file_path} holds {pd.Timedelta(base_width)} bars, too coarse for "
+                         f"{timeframe} bars")
+
+def build_timeframe_pyramid(file_path, timeframes=None):
+    # Each level is aggregated from the level below it (not from the base bars) and written
+    # next to the base cache. timeframes=None builds every level coarser than the source; a
+    # level as coarse as the source is the source itself and a finer one raises ValueError
+    base_dir = _cache_dir(file_path)
+    columns = load_columns(file_path)
+    base_meta = _read_cache_meta(base_dir)
+    base_width = _bar_width(columns['datetime'])
+    if timeframes is None:
+        timeframes = [name for name in TIMEFRAMES if TIMEFRAMES[name] > base_width]
+    for timeframe in timeframes:
+        _check_timeframe(file_path, timeframe, base_width)
+    for timeframe in sorted(timeframes, key=TIMEFRAMES.get):
+        if TIMEFRAMES[timeframe] <= base_width:
+            continue
+        level_dir = os.path.join(base_dir, timeframe)
+        meta = _read_cache_meta(level_dir)
+        if meta is not None and meta.get('source_sha256') == base_meta['sha256']:
+            columns = _map_columns(level_dir)
+            continue
+        columns = resample_columns(columns, timeframe)
+        _write_columns(level_dir, columns, {'source_sha256': base_meta['sha256']})
+        columns = _map_columns(level_dir)
+    return base_dir
+
+def _write_columns(cache_dir, columns, meta):
+    os.makedirs(cache_dir, exist_ok=True)
+    if os.path.exists(os.path.join(cache_dir, 'meta.json')):
+        os.remove(os.path.join(cache_dir, 'meta.json'))
+    for name in ['datetime'] + PRICE_COLUMNS:
+        dtype = np.int64 if name == 'datetime' else np.float64
+        np.asarray(columns[name], dtype=dtype).tofile(os.path.join(cache_dir, f"{name}.bin"))
+    _write_cache_meta(cache_dir, dict(meta, rows=len(columns['datetime'])))
+
+def load_timeframe(file_path, timeframe, start=None, end=None):
+    columns = load_columns(file_path)
+    base_width = _bar_width(columns['datetime'])
+    _check_timeframe(file_path, timeframe, base_width)
+    if TIMEFRAMES[timeframe] == base_width:
+        return _slice_columns(columns, start, end)
+    level_dir = os.path.join(_cache_dir(file_path), timeframe)
+    meta = _read_cache_meta(level_dir)
+    if meta is None or meta.get('source_sha256') != _read_cache_meta(_cache_dir(file_path))['sha256']:
+        build_timeframe_pyramid(file_path, [name for name in TIMEFRAMES
+                                            if base_width < TIMEFRAMES[name] <= TIMEFRAMES[timeframe]])
+    return _slice_columns(_map_columns(level_dir), start, end)
+
+def annualisation_factor(data, default=252):
+    # Bars per year from the median bar spacing of a DatetimeIndex or a 'datetime' column of
+    # epoch nanoseconds (crypto trades every day, so a year is 365.25 days of bars)
+    if isinstance(data, pd.DataFrame):
+        timestamps = (data.index.as_unit('ns').asi8 if isinstance(data.index, pd.DatetimeIndex)
+                      else None)
+    elif isinstance(data, dict) and 'datetime' in data:
+        timestamps = np.asarray(data['datetime'])
+    else:
+        timestamps = None
+    if timestamps is None or _bar_width(timestamps) <= 0:
+        return default
+    return SECONDS_PER_YEAR * 10**9 / _bar_width(timestamps)
 
 def moving_average_crossover(data, short_window, long_window, output_file):
     data['Short_MA'] = data['close'].rolling(window=short_window).mean()
@@ -20,6 +248,22 @@ def moving_average_crossover(data, short_window, long_window, output_file):
 
     return data
 
+def indicator_crossover(data, fast, slow, output_file=None, extra=None):
+    # Generalised moving_average_crossover: fast/slow are indicator specs for
+    # compute_indicators, e.g. ('ema', {'span': 12}) or ('macd', {}, 'signal'). Any extra specs
+    # are computed in the same pass and added as columns. Lines are stored as Short_MA/Long_MA
+    # so backtest_strategy and visualize_results work unchanged
+    specs = dict(extra or {})
+    specs.update({'Short_MA': fast, 'Long_MA': slow})
+    lines = compute_indicators(data, specs)
+    for name, values in lines.items():
+        data[name] = values
+    data['Signal'] = _crossover_signals(lines['Short_MA'], lines['Long_MA']).astype(np.int64)
+
+    if output_file:
+        data[['close', 'Short_MA', 'Long_MA', 'Signal']].to_csv(output_file)
+    return data
+
 def backtest_strategy(data, initial_capital=10000):
     data['Daily_Return'] = data['close'].pct_change().fillna(0)
     data['Strategy_Return'] = data['Signal'].shift(1) * data['Daily_Return']
@@ -32,62 +276,631 @@ def backtest_strategy(data, initial_capital=10000):
     data['BuyHold_Profit'] = initial_capital * data['Cumulative_BuyHold']
     return data
 
-def calculate_sharpe_ratio(data, risk_free_rate=0.02):
-    excess_returns = data['Strategy_Return'] - (risk_free_rate / 252)
-    sharpe_ratio = np.sqrt(252) * excess_returns.mean() / excess_returns.std()
+def calculate_sharpe_ratio(data, risk_free_rate=0.02, periods_per_year=None):
+    # Annualised from the bar frequency unless given; 252 only when the index carries no times
+    periods_per_year = periods_per_year or annualisation_factor(data)
+    excess_returns = data['Strategy_Return'] - (risk_free_rate / periods_per_year)
+    sharpe_ratio = np.sqrt(periods_per_year) * excess_returns.mean() / excess_returns.std()
     return sharpe_ratio
 
+def _trade_segments(signal):
+    # A trade is a run of bars holding the same non-zero position; the position held over
+    # bar t is the signal of bar t - 1, so runs are found from one diff of the shifted signal
+    position = np.zeros(len(signal))
+    position[1:] = signal[:-1]
+    changes = np.flatnonzero(position[1:] != position[:-1]) + 1
+    starts = np.concatenate(([0], changes))
+    ends = np.concatenate((changes, [len(position)]))
+    direction = position[starts]
+    held = direction != 0
+    return starts[held], ends[held], direction[held]
+
+def _trade_ledger_arrays(signal, equity):
+    starts, ends, direction = _trade_segments(signal)
+    entry_equity = equity[starts - 1]
+    pnl = equity[ends - 1] - entry_equity
+
+    # reduceat over [start, end, start, end, ...] reduces each trade and each gap between
+    # trades in one call; the gaps (odd slots) are dropped
+    bounds = np.column_stack((starts, ends)).ravel()
+    if len(bounds) and bounds[-1] == len(equity):
+        bounds = bounds[:-1]
+    if len(bounds):
+        mfe = np.maximum.reduceat(equity, bounds)[::2] - entry_equity
+        mae = np.minimum.reduceat(equity, bounds)[::2] - entry_equity
+    else:
+        mfe = mae = np.empty(0)
+    return {'starts': starts, 'ends': ends, 'direction': direction, 'entry_equity': entry_equity,
+            'pnl': pnl, 'mae': mae, 'mfe': mfe}
+
+def _max_drawdown_duration(equity):
+    # Longest run of bars spent below the previous equity peak
+    at_peak = np.flatnonzero(equity >= np.maximum.accumulate(equity))
+    if not len(at_peak):
+        return 0
+    return int(np.diff(np.concatenate((at_peak, [len(equity)]))).max() - 1)
+
+def build_trade_ledger(data):
+    signal = data['Signal'].to_numpy(dtype=np.float64)
+    equity = data['Strategy_Profit'].to_numpy(dtype=np.float64)
+    close = data['close'].to_numpy(dtype=np.float64)
+    ledger = _trade_ledger_arrays(signal, equity)
+    # Positions are opened and closed at the close of the bar whose signal changed
+    entry_bar = ledger['starts'] - 1
+    exit_bar = ledger['ends'] - 1
+    return pd.DataFrame({
+        'Entry': data.index[entry_bar],
+        'Exit': data.index[exit_bar],
+        'Direction': ledger['direction'].astype(np.int64),
+        'Bars': ledger['ends'] - ledger['starts'],
+        'Entry_Price': close[entry_bar],
+        'Exit_Price': close[exit_bar],
+        'PnL': ledger['pnl'],
+        'Return': ledger['pnl'] / ledger['entry_equity'],
+        'MAE': ledger['mae'],
+        'MFE': ledger['mfe']
+    })
+
 def calculate_trade_statistics(data):
-    trades = data[data['Signal'] != 0]  # Only consider rows where a trade occurred
-    total_trades = len(trades)
-    trades['Profit'] = trades['Strategy_Return'] * trades['close']
-    winning_trades = trades[trades['Profit'] > 0]
-    losing_trades = trades[trades['Profit'] < 0]
-
-    gross_profit = winning_trades['Profit'].sum()
-    net_profit = trades['Profit'].sum()
-    largest_win = winning_trades['Profit'].max() if not winning_trades.empty else 0
-    smallest_win = winning_trades['Profit'].min() if not winning_trades.empty else 0
-    largest_loss = losing_trades['Profit'].min() if not losing_trades.empty else 0
-    max_drawdown = (data['Strategy_Profit'].cummax() - data['Strategy_Profit']).max()
-
-    long_trades = len(trades[trades['Signal'] == 1])
-    short_trades = len(trades[trades['Signal'] == -1])
-    win_percentage = len(winning_trades) / total_trades * 100 if total_trades > 0 else 0
+    equity = data['Strategy_Profit'].to_numpy(dtype=np.float64)
+    ledger = _trade_ledger_arrays(data['Signal'].to_numpy(dtype=np.float64), equity)
+    pnl = ledger['pnl']
+    holding = ledger['ends'] - ledger['starts']
+    wins = pnl > 0
+    losses = pnl < 0
+    total_trades = len(pnl)
+
+    gross_profit = pnl[wins].sum()
+    gross_loss = pnl[losses].sum()
+    if gross_loss < 0:
+        profit_factor = gross_profit / -gross_loss
+    else:
+        profit_factor = np.inf if gross_profit > 0 else 0
 
     return {
         'Total Trades': total_trades,
-        'Winning Trades': len(winning_trades),
-        'Losing Trades': len(losing_trades),
+        'Winning Trades': int(wins.sum()),
+        'Losing Trades': int(losses.sum()),
         'Gross Profit': gross_profit,
-        'Net Profit': net_profit,
-        'Largest Win': largest_win,
-        'Smallest Win': smallest_win,
-        'Largest Loss': largest_loss,
-        'Max Drawdown': max_drawdown,
-        'Long Trades': long_trades,
-        'Short Trades': short_trades,
-        'Win Percentage': win_percentage
+        'Gross Loss': gross_loss,
+        'Net Profit': pnl.sum(),
+        'Profit Factor': profit_factor,
+        'Largest Win': pnl[wins].max() if wins.any() else 0,
+        'Smallest Win': pnl[wins].min() if wins.any() else 0,
+        'Largest Loss': pnl[losses].min() if losses.any() else 0,
+        'Average Holding Period': holding.mean() if total_trades > 0 else 0,
+        'Largest MAE': ledger['mae'].min() if total_trades > 0 else 0,
+        'Largest MFE': ledger['mfe'].max() if total_trades > 0 else 0,
+        'Max Drawdown': (np.maximum.accumulate(equity) - equity).max() if len(equity) else 0,
+        'Max Drawdown Duration': _max_drawdown_duration(equity),
+        'Long Trades': int((ledger['direction'] == 1).sum()),
+        'Short Trades': int((ledger['direction'] == -1).sum()),
+        'Win Percentage': wins.sum() / total_trades * 100 if total_trades > 0 else 0
     }
 
-def visualize_results(data):
-    plt.figure(figsize=(12, 6))
-    plt.subplot(2, 1, 1)
-    plt.plot(data.index, data['close'], label='Close Price', color='black')
-    plt.plot(data.index, data['Short_MA'], label='Short MA', color='blue', linestyle='--')
-    plt.plot(data.index, data['Long_MA'], label='Long MA', color='orange', linestyle='--')
-    plt.title('Bitcoin Price with Moving Averages')
-    plt.legend()
-
-    plt.subplot(2, 1, 2)
-    plt.plot(data.index, data['Strategy_Profit'], label='Strategy Profit ($)', color='green')
-    plt.plot(data.index, data['BuyHold_Profit'], label='Buy & Hold Profit ($)', color='red')
-    plt.title('Cumulative Profits')
-    plt.legend()
-
-    plt.tight_layout()
+def _close_array(data):
+    # Accepts a frame (or column mapping) with a 'close' column, a Series or a raw array
+    if isinstance(data, (pd.DataFrame, dict)):
+        data = data['close']
+    return np.asarray(data, dtype=np.float64)
+
+def _rolling_means(close, windows):
+    # One cumulative-sum pass serves every window: mean[t] = (csum[t + 1] - csum[t + 1 - w]) / w
+    csum = np.concatenate(([0.0], np.cumsum(close)))
+    means = np.full((len(windows), len(close)), np.nan)
+    for row, window in enumerate(windows):
+        if window <= len(close):
+            means[row, window - 1:] = (csum[window:] - csum[:-window]) / window
+    return means
+
+def _bar_returns(close):
+    # Same values as close.pct_change().fillna(0)
+    returns = np.zeros_like(close)
+    returns[1:] = close[1:] / close[:-1] - 1
+    return returns
+
+def _crossover_signals(short_ma, long_ma):
+    # +1 / -1 / 0 exactly like moving_average_crossover; NaN warm-up bars stay flat
+    signals = np.sign(short_ma - long_ma)
+    signals[np.isnan(signals)] = 0
+    return signals
+
+def _strategy_returns(signals, returns):
+    # Yesterday's signal earns today's return, as in backtest_strategy
+    strategy_returns = np.zeros(signals.shape)
+    strategy_returns[..., 1:] = signals[..., :-1] * returns[1:]
+    return strategy_returns
+
+def _performance_metrics(strategy_returns, equity, initial_capital, risk_free_rate,
+                         periods_per_year=252):
+    excess_returns = strategy_returns - risk_free_rate / periods_per_year
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sharpe_ratio = (np.sqrt(periods_per_year) * excess_returns.mean(axis=-1)
+                        / excess_returns.std(axis=-1, ddof=1))
+    net_profit = equity[..., -1] - initial_capital
+    max_drawdown = (np.maximum.accumulate(equity, axis=-1) - equity).max(axis=-1)
+    return sharpe_ratio, net_profit, max_drawdown
+
+def sweep_parameters(data, short_windows, long_windows, initial_capital=10000,
+                     risk_free_rate=0.02, max_bytes=256 * 2**20, trade_stats=False,
+                     periods_per_year=None):
+    close = _close_array(data)
+    periods_per_year = periods_per_year or annualisation_factor(data)
+    pairs = np.array([(short, long) for short in short_windows for long in long_windows
+                      if short < long], dtype=np.int64).reshape(-1, 2)
+    windows = np.unique(pairs)
+    means = _rolling_means(close, windows)
+    short_rows = np.searchsorted(windows, pairs[:, 0])
+    long_rows = np.searchsorted(windows, pairs[:, 1])
+    returns = _bar_returns(close)
+
+    sharpe_ratio = np.empty(len(pairs))
+    net_profit = np.empty(len(pairs))
+    max_drawdown = np.empty(len(pairs))
+    if trade_stats:
+        total_trades = np.zeros(len(pairs), dtype=np.int64)
+        profit_factor = np.zeros(len(pairs))
+        win_percentage = np.zeros(len(pairs))
+    # Pairs are evaluated as (chunk x bars) blocks; a handful of temporaries of that shape are
+    # alive at once, so the chunk size keeps them under max_bytes
+    chunk_size = max(1, max_bytes // (8 * 4 * max(len(close), 1)))
+    for start in range(0, len(pairs), chunk_size):
+        stop = start + chunk_size
+        signals = _crossover_signals(means[short_rows[start:stop]], means[long_rows[start:stop]])
+        strategy_returns = _strategy_returns(signals, returns)
+        equity = initial_capital * np.cumprod(1 + strategy_returns, axis=-1)
+        sharpe_ratio[start:stop], net_profit[start:stop], max_drawdown[start:stop] = \
+            _performance_metrics(strategy_returns, equity, initial_capital, risk_free_rate,
+                                 periods_per_year)
+        if trade_stats:
+            # Ledgers are built one pair at a time so only the per-trade arrays are extra
+            for row in range(len(signals)):
+                pnl = _trade_ledger_arrays(signals[row], equity[row])['pnl']
+                gross_loss = -pnl[pnl < 0].sum()
+                total_trades[start + row] = len(pnl)
+                profit_factor[start + row] = (pnl[pnl > 0].sum() / gross_loss if gross_loss > 0
+                                              else np.inf if (pnl > 0).any() else 0)
+                win_percentage[start + row] = (pnl > 0).mean() * 100 if len(pnl) else 0
+
+    results = pd.DataFrame({
+        'Short_Window': pairs[:, 0],
+        'Long_Window': pairs[:, 1],
+        'Sharpe_Ratio': sharpe_ratio,
+        'Net_Profit': net_profit,
+        'Max_Drawdown': max_drawdown
+    })
+    if trade_stats:
+        results['Total_Trades'] = total_trades
+        results['Profit_Factor'] = profit_factor
+        results['Win_Percentage'] = win_percentage
+    # Stable sort keeps grid order among ties so the ranking is reproducible
+    return results.sort_values('Sharpe_Ratio', ascending=False, kind='mergesort', ignore_index=True)
+
+def walk_forward_windows(n_bars, in_sample, out_of_sample, step=None):
+    # (in-sample start, in-sample end / out-of-sample start, out-of-sample end) per fold
+    step = step or out_of_sample
+    return [(start, start + in_sample, start + in_sample + out_of_sample)
+            for start in range(0, n_bars - in_sample - out_of_sample + 1, step)]
+
+def _evaluate_fold(close, fold, short_windows, long_windows, initial_capital, risk_free_rate,
+                   periods_per_year):
+    is_start, is_end, oos_end = fold
+    ranking = sweep_parameters(close[is_start:is_end], short_windows, long_windows,
+                               initial_capital=initial_capital, risk_free_rate=risk_free_rate,
+                               periods_per_year=periods_per_year)
+    best = ranking.iloc[0]
+    short_window, long_window = int(best['Short_Window']), int(best['Long_Window'])
+
+    # The first out-of-sample return trades on the signal of the last in-sample bar, so the
+    # moving averages are warmed up on the long_window bars that precede the fold
+    history_start = max(0, is_end - long_window)
+    history = close[history_start:oos_end]
+    means = _rolling_means(history, [short_window, long_window])
+    signals = _crossover_signals(means[0], means[1])
+    strategy_returns = _strategy_returns(signals, _bar_returns(history))[is_end - history_start:]
+    equity = initial_capital * np.cumprod(1 + strategy_returns)
+    sharpe_ratio, net_profit, max_drawdown = _performance_metrics(
+        strategy_returns, equity, initial_capital, risk_free_rate, periods_per_year)
+    return (short_window, long_window, float(best['Sharpe_Ratio']),
+            float(sharpe_ratio), float(net_profit), float(max_drawdown))
+
+def _share_array(array):
+    # Copies array into a new shared-memory block; the caller closes and unlinks it
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[:] = array
+    return shm
+
+def _walk_forward_worker(shm_name, n_bars, fold, args):
+    # Workers map the parent's price array instead of receiving a pickled copy
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        close = np.ndarray((n_bars,), dtype=np.float64, buffer=shm.buf)
+        result = _evaluate_fold(close, fold, *args)
+        del close
+        return result
+    finally:
+        shm.close()
+
+def walk_forward(data, short_windows, long_windows, in_sample, out_of_sample, step=None,
+                 initial_capital=10000, risk_free_rate=0.02, max_workers=None,
+                 periods_per_year=None):
+    close = _close_array(data)
+    periods_per_year = periods_per_year or annualisation_factor(data)
+    folds = walk_forward_windows(len(close), in_sample, out_of_sample, step)
+    args = (list(short_windows), list(long_windows), initial_capital, risk_free_rate,
+            periods_per_year)
+    max_workers = min(max_workers or os.cpu_count() or 1, max(len(folds), 1))
+
+    if max_workers == 1:
+        results = [_evaluate_fold(close, fold, *args) for fold in folds]
+    else:
+        shm = _share_array(close)
+        try:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                # map() yields in fold order, so the table is identical for any worker count
+                results = list(executor.map(_walk_forward_worker, [shm.name] * len(folds),
+                                            [len(close)] * len(folds), folds,
+                                            [args] * len(folds)))
+        finally:
+            shm.close()
+            shm.unlink()
+
+    folds = np.array(folds, dtype=np.int64).reshape(-1, 3)
+    results = pd.DataFrame(results, columns=['Short_Window', 'Long_Window', 'IS_Sharpe',
+                                             'OOS_Sharpe', 'OOS_Net_Profit', 'OOS_Max_Drawdown'])
+    results.insert(0, 'IS_Start', folds[:, 0])
+    results.insert(1, 'OOS_Start', folds[:, 1])
+    results.insert(2, 'OOS_End', folds[:, 2])
+    if isinstance(data, pd.DataFrame) and len(folds):
+        results['OOS_Start'] = data.index[folds[:, 1]]
+        results['IS_Start'] = data.index[folds[:, 0]]
+        results['OOS_End'] = data.index[folds[:, 2] - 1]
+    return results
+
+def load_panel(file_paths):
+    # file_paths: {symbol: csv path} or a list of paths (symbol = file name). Every asset is
+    # read through the columnar cache and scattered into one (time x asset) close panel on the
+    # union of timestamps; gaps after an asset's first bar are forward-filled
+    if not isinstance(file_paths, dict):
+        file_paths = {os.path.splitext(os.path.basename(path))[0]: path for path in file_paths}
+    symbols = list(file_paths)
+    columns = [load_columns(file_paths[symbol]) for symbol in symbols]
+    timestamps = np.unique(np.concatenate([column['datetime'] for column in columns]))
+
+    panel = np.full((len(timestamps), len(symbols)), np.nan)
+    for asset, column in enumerate(columns):
+        panel[np.searchsorted(timestamps, column['datetime']), asset] = column['close']
+    last_seen = np.where(~np.isnan(panel), np.arange(len(timestamps))[:, None], 0)
+    np.maximum.accumulate(last_seen, axis=0, out=last_seen)
+    panel = panel[last_seen, np.arange(len(symbols))]
+    return pd.DatetimeIndex(timestamps.view('datetime64[ns]'), name='datetime'), symbols, panel
+
+def _rolling_mean_panel(panel, window):
+    # Cumulative-sum rolling mean down the time axis; a window touching a missing value is NaN
+    valid = ~np.isnan(panel)
+    csum = np.zeros((len(panel) + 1, panel.shape[1]))
+    np.cumsum(np.where(valid, panel, 0), axis=0, out=csum[1:])
+    counts = np.zeros((len(panel) + 1, panel.shape[1]), dtype=np.int64)
+    np.cumsum(valid, axis=0, out=counts[1:])
+    means = np.full(panel.shape, np.nan)
+    if window <= len(panel):
+        means[window - 1:] = (csum[window:] - csum[:-window]) / window
+        means[window - 1:][counts[window:] - counts[:-window] < window] = np.nan
+    return means
+
+def _portfolio_weights(weights, symbols):
+    if weights is None:
+        return np.full(len(symbols), 1 / len(symbols))
+    if isinstance(weights, dict):
+        return np.array([weights.get(symbol, 0.0) for symbol in symbols], dtype=np.float64)
+    return np.asarray(weights, dtype=np.float64)
+
+def portfolio_backtest(timestamps, symbols, panel, short_window, long_window, weights=None,
+                       rebalance=None, transaction_cost=0.0, initial_capital=10000):
+    # Crossover signals for every asset at once, then one sleeve per asset at its target
+    # weight (any unallocated weight stays in cash). rebalance=None lets sleeves drift,
+    # rebalance=k resets them to target every k bars. transaction_cost is a fraction of traded
+    # value, charged on signal flips inside a sleeve and on rebalancing turnover
+    weights = _portfolio_weights(weights, symbols)
+    cash = 1 - weights.sum()
+    signals = _crossover_signals(_rolling_mean_panel(panel, short_window),
+                                 _rolling_mean_panel(panel, long_window))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns = np.nan_to_num(_bar_returns(panel), nan=0.0, posinf=0.0, neginf=0.0)
+
+    position = np.zeros_like(signals)
+    position[1:] = signals[:-1]
+    growth = 1 + position * returns
+    del returns
+    growth[1:] -= transaction_cost * np.abs(position[1:] - position[:-1])
+    del position, signals
+
+    equity = np.empty(len(panel))
+    rebalance_cost = np.zeros(len(panel))
+    if rebalance == 1:
+        # Constant-mix: the whole path is vectorised; turnover is the drift of one bar
+        sleeve_growth = growth * weights
+        gross = sleeve_growth.sum(axis=1) + cash
+        turnover = np.abs(weights - sleeve_growth / gross[:, None]).sum(axis=1)
+        turnover[-1] = 0
+        net = gross * (1 - transaction_cost * turnover)
+        equity[:] = initial_capital * np.cumprod(net)
+        rebalance_cost[:] = equity / (1 - transaction_cost * turnover) * transaction_cost * turnover
+    else:
+        step = rebalance or len(panel)
+        value = initial_capital
+        for start in range(0, len(panel), step):
+            if start:
+                turnover = np.abs(weights - sleeves[-1] / value).sum()
+                rebalance_cost[start - 1] = value * turnover * transaction_cost
+                value -= rebalance_cost[start - 1]
+                equity[start - 1] = value
+            sleeves = value * weights * np.cumprod(growth[start:start + step], axis=0)
+            equity[start:start + step] = sleeves.sum(axis=1) + value * cash
+            value = equity[start + len(sleeves) - 1]
+
+    strategy_return = np.empty(len(panel))
+    strategy_return[0] = equity[0] / initial_capital - 1
+    strategy_return[1:] = equity[1:] / equity[:-1] - 1
+    return pd.DataFrame({'Strategy_Return': strategy_return, 'Strategy_Profit': equity,
+                         'Rebalance_Cost': rebalance_cost}, index=timestamps)
+
+Bar = namedtuple('Bar', ['datetime', 'open', 'high', 'low', 'close', 'volume'])
+Signal = namedtuple('Signal', ['datetime', 'close', 'short_ma', 'long_ma', 'signal', 'daily_return',
+                               'strategy_return', 'strategy_profit', 'drawdown'])
+
+class RollingMean:
+    # Fixed-window running mean in O(1) per value. It mirrors pandas' rolling().mean() kernel
+    # (Kahan-compensated add/remove sums, sign and constant-run corrections) so the streamed
+    # values are bit-for-bit the batch ones
+    def __init__(self, window):
+        self.window = window
+        self.buffer = [0.0] * window
+        self.position = 0
+        self.seen = 0
+        self.nobs = 0
+        self.sum = 0.0
+        self.compensation_add = 0.0
+        self.compensation_remove = 0.0
+        self.neg_ct = 0
+        self.same_count = 0
+        self.prev_value = math.nan
+
+    def _add(self, value):
+        if value == value:
+            self.nobs += 1
+            y = value - self.compensation_add
+            t = self.sum + y
+            self.compensation_add = t - self.sum - y
+            self.sum = t
+            if math.copysign(1.0, value) < 0:
+                self.neg_ct += 1
+            self.same_count = self.same_count + 1 if value == self.prev_value else 1
+            self.prev_value = value
+
+    def _remove(self, value):
+        if value == value:
+            self.nobs -= 1
+            y = -value - self.compensation_remove
+            t = self.sum + y
+            self.compensation_remove = t - self.sum - y
+            self.sum = t
+            if math.copysign(1.0, value) < 0:
+                self.neg_ct -= 1
+
+    def update(self, value):
+        if self.window == 1:
+            # Windows of one bar never overlap, so pandas restarts the sum on every value
+            self.sum = self.compensation_add = self.compensation_remove = 0.0
+            self.nobs = self.neg_ct = self.same_count = 0
+            self.prev_value = value
+        elif self.seen >= self.window:
+            self._remove(self.buffer[self.position])
+        self._add(value)
+        self.buffer[self.position] = value
+        self.position = (self.position + 1) % self.window
+        self.seen += 1
+
+        if self.nobs < self.window:
+            return math.nan
+        if self.same_count >= self.nobs:
+            return self.prev_value
+        result = self.sum / self.nobs
+        if self.neg_ct == 0 and result < 0:
+            return 0.0
+        if self.neg_ct == self.nobs and result > 0:
+            return 0.0
+        return result
+
+class StreamingCrossover:
+    # Incremental moving_average_crossover + backtest_strategy: each bar costs O(1)
+    def __init__(self, short_window, long_window, initial_capital=10000):
+        self.short_ma = RollingMean(short_window)
+        self.long_ma = RollingMean(long_window)
+        self.initial_capital = initial_capital
+        self.prev_close = None
+        self.prev_signal = 0
+        self.cumulative_strategy = 1.0
+        self.peak_profit = -math.inf
+
+    def update(self, bar):
+        short_ma = self.short_ma.update(bar.close)
+        long_ma = self.long_ma.update(bar.close)
+        signal = 1 if short_ma > long_ma else -1 if short_ma < long_ma else 0
+
+        if self.prev_close is None:
+            daily_return = 0.0
+            strategy_return = 0.0
+        else:
+            if self.prev_close == 0:
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    daily_return = float(np.float64(bar.close) / self.prev_close) - 1
+            else:
+                daily_return = bar.close / self.prev_close - 1
+            # fillna(0) in the batch path also zeroes undefined returns mid-series
+            if daily_return != daily_return:
+                daily_return = 0.0
+            strategy_return = float(self.prev_signal) * daily_return
+            if strategy_return != strategy_return:
+                strategy_return = 0.0
+        self.cumulative_strategy *= 1 + strategy_return
+        strategy_profit = self.initial_capital * self.cumulative_strategy
+        self.peak_profit = max(self.peak_profit, strategy_profit)
+
+        self.prev_close = bar.close
+        self.prev_signal = signal
+        return Signal(bar.datetime, bar.close, short_ma, long_ma, signal, daily_return,
+                      strategy_return, strategy_profit, self.peak_profit - strategy_profit)
+
+def stream_signals(bars, short_window, long_window, initial_capital=10000):
+    engine = StreamingCrossover(short_window, long_window, initial_capital)
+    for bar in bars:
+        yield engine.update(bar)
+
+async def astream_signals(bars, short_window, long_window, initial_capital=10000):
+    # Same as stream_signals for an async iterator of bars (e.g. a websocket feed)
+    engine = StreamingCrossover(short_window, long_window, initial_capital)
+    async for bar in bars:
+        yield engine.update(bar)
+
+def read_bars(file_path):
+    # Lazily yields Bar tuples from a CSV in the load_data layout
+    with open(file_path, newline='') as csv_file:
+        for row in csv.DictReader(csv_file):
+            yield Bar(pd.Timestamp(row['datetime']), float(row['open']), float(row['high']),
+                      float(row['low']), float(row['close']), float(row['volume']))
+
+def _minmax_decimate(values, buckets):
+    # Indices of the min and max of every bucket (plus both ends): drawn as a line this is
+    # pixel-identical to the full series at `buckets` pixels wide, peaks and troughs included
+    n_values = len(values)
+    if n_values <= 4 * buckets:
+        return np.arange(n_values)
+    size = -(-n_values // buckets)
+    rows = -(-n_values // size)
+    padded = np.full(rows * size, np.inf)
+    padded[:n_values] = np.where(np.isnan(values), np.inf, values)
+    lows = padded.reshape(rows, size).argmin(axis=1)
+    padded[:n_values] = np.where(np.isnan(values), -np.inf, values)
+    padded[n_values:] = -np.inf
+    highs = padded.reshape(rows, size).argmax(axis=1)
+    offsets = np.arange(rows) * size
+    return np.unique(np.concatenate(([0, n_values - 1], lows + offsets, highs + offsets)))
+
+def _result_panels(close, short_ma, long_ma, strategy_profit, buyhold_profit):
+    return [
+        ('Bitcoin Price with Moving Averages', [
+            ('Close Price', close, {'color': 'black'}),
+            ('Short MA', short_ma, {'color': 'blue', 'linestyle': '--'}),
+            ('Long MA', long_ma, {'color': 'orange', 'linestyle': '--'})]),
+        ('Cumulative Profits', [
+            ('Strategy Profit ($)', strategy_profit, {'color': 'green'}),
+            ('Buy & Hold Profit ($)', buyhold_profit, {'color': 'red'})])
+    ]
+
+def _draw_panels(figure, timestamps, panels, width_px, title=None):
+    for row, (panel_title, lines) in enumerate(panels, start=1):
+        axes = figure.add_subplot(len(panels), 1, row)
+        for label, values, style in lines:
+            keep = _minmax_decimate(values, width_px)
+            axes.plot(timestamps[keep], values[keep], label=label, **style)
+        axes.set_title(panel_title)
+        axes.legend()
+    if title:
+        figure.suptitle(title)
+    figure.tight_layout()
+
+def _render_figure(output_file, timestamps, panels, width_px, height_px, dpi, title=None):
+    # A bare Agg canvas: no pyplot state and no GUI, so it is safe in workers and batch jobs
+    figure = Figure(figsize=(width_px / dpi, height_px / dpi), dpi=dpi)
+    FigureCanvasAgg(figure)
+    _draw_panels(figure, timestamps, panels, width_px, title)
+    figure.savefig(output_file)
+
+def visualize_results(data, output_file=None, width_px=1200, height_px=600, dpi=100):
+    # Series are decimated to the figure width either way; with output_file (.png, .svg, ...)
+    # the figure is rendered headless instead of shown
+    timestamps = data.index.to_numpy()
+    panels = _result_panels(*(data[name].to_numpy(dtype=np.float64) for name in
+                              ['close', 'Short_MA', 'Long_MA', 'Strategy_Profit', 'BuyHold_Profit']))
+    if output_file:
+        _render_figure(output_file, timestamps, panels, width_px, height_px, dpi)
+        return output_file
+
+    figure = plt.figure(figsize=(width_px / dpi, height_px / dpi), dpi=dpi)
+    _draw_panels(figure, timestamps, panels, width_px)
     plt.show()
 
+def _timestamps_ns(data):
+    if isinstance(data, pd.DataFrame) and isinstance(data.index, pd.DatetimeIndex):
+        return data.index.as_unit('ns').asi8
+    if isinstance(data, dict) and 'datetime' in data:
+        return np.asarray(data['datetime'], dtype=np.int64)
+    return np.arange(len(_close_array(data)), dtype=np.int64)
+
+def _render_pair(close, timestamps, short_window, long_window, output_file, initial_capital,
+                 width_px, height_px, dpi):
+    # Full-length series live only while this one figure is drawn
+    means = _rolling_means(close, [short_window, long_window])
+    returns = _bar_returns(close)
+    strategy_returns = _strategy_returns(_crossover_signals(means[0], means[1]), returns)
+    panels = _result_panels(close, means[0], means[1],
+                            initial_capital * np.cumprod(1 + strategy_returns),
+                            initial_capital * np.cumprod(1 + returns))
+    _render_figure(output_file, timestamps.view('datetime64[ns]'), panels, width_px, height_px,
+                   dpi, title=f"Short MA {short_window} / Long MA {long_window}")
+    return output_file
+
+def _render_pair_worker(close_name, time_name, n_bars, job, options):
+    close_shm = shared_memory.SharedMemory(name=close_name)
+    time_shm = shared_memory.SharedMemory(name=time_name)
+    try:
+        close = np.ndarray((n_bars,), dtype=np.float64, buffer=close_shm.buf)
+        timestamps = np.ndarray((n_bars,), dtype=np.int64, buffer=time_shm.buf)
+        result = _render_pair(close, timestamps, *job, *options)
+        del close, timestamps
+        return result
+    finally:
+        close_shm.close()
+        time_shm.close()
+
+def render_sweep_report(data, sweep, output_dir, top=20, fmt='png', initial_capital=10000,
+                        width_px=1200, height_px=600, dpi=100, max_workers=None):
+    # One decimated figure per top-ranked pair of a sweep_parameters table plus an index.html.
+    # Workers share the close/timestamp arrays and rebuild each pair's curves themselves, so no
+    # full series is pickled or kept once its figure is written
+    os.makedirs(output_dir, exist_ok=True)
+    close = _close_array(data)
+    timestamps = _timestamps_ns(data)
+    rows = sweep.head(top)
+    jobs = [(int(row.Short_Window), int(row.Long_Window),
+             os.path.join(output_dir, f"pair_{int(row.Short_Window)}_{int(row.Long_Window)}.{fmt}"))
+            for row in rows.itertuples()]
+    options = (initial_capital, width_px, height_px, dpi)
+    max_workers = min(max_workers or os.cpu_count() or 1, max(len(jobs), 1))
+
+    if max_workers == 1:
+        paths = [_render_pair(close, timestamps, *job, *options) for job in jobs]
+    else:
+        close_shm = _share_array(close)
+        time_shm = _share_array(timestamps)
+        try:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                paths = list(executor.map(_render_pair_worker, [close_shm.name] * len(jobs),
+                                          [time_shm.name] * len(jobs), [len(close)] * len(jobs),
+                                          jobs, [options] * len(jobs)))
+        finally:
+            for shm in (close_shm, time_shm):
+                shm.close()
+                shm.unlink()
+
+    with open(os.path.join(output_dir, 'index.html'), 'w') as index:
+        index.write(f"<html><body>\n{rows.to_html(index=False)}\n")
+        for path in paths:
+            index.write(f'<p><img src="{os.path.basename(path)}"></p>\n')
+        index.write("</body></html>\n")
+    return paths
+
 if __name__ == "__main__":
     file_path = "BTC_Data _(2019-2023)\\BTC_2019_2023_1w.csv"  # Replace with the path to your CSV file
     output_file = "signals.csv"
@@ -110,4 +923,8 @@ if __name__ == "__main__":
     for key, value in trade_stats.items():
         print(f"{key}: {value}")
 
+    sweep = sweep_parameters(data, range(2, 102), range(2, 102), initial_capital=initial_capital)
+    print("Top Parameter Pairs:")
+    print(sweep.head(10).to_string(index=False))
+
     visualize_results(data)
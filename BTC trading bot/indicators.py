@@ -0,0 +1,202 @@
+import numpy as np
+import pandas as pd
+
+try:
+    from numba import njit
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
+
+# Every indicator takes raw float64 arrays and returns arrays of the same length, NaN during
+# warm-up. Recursive smoothers (EMA, Wilder) and the rolling standard deviation run as
+# compiled loops under Numba; without it they go through pandas' compiled ewm/rolling, and
+# the cumulative kernels (SMA, WMA) are plain NumPy either way.
+#
+# A NaN input is a missing bar and is handled the way pandas does on both paths: windowed
+# indicators (SMA, WMA, Bollinger) are NaN while it is inside their window, the recursive ones
+# (EMA, RSI, ATR, MACD) carry their last value across it.
+
+def _ewm_loop(values, alpha):
+    # Same recurrence as pandas' ewm(alpha=alpha, adjust=False).mean(); leading NaNs stay NaN
+    # and a NaN bar keeps the previous value while its weight keeps decaying
+    out = np.empty(len(values))
+    weighted = np.nan
+    old_wt = 1.0
+    for i in range(len(values)):
+        value = values[i]
+        if weighted == weighted:
+            old_wt *= 1 - alpha
+            if value == value:
+                if weighted != value:
+                    weighted = (old_wt * weighted + alpha * value) / (old_wt + alpha)
+                old_wt = 1.0
+        elif value == value:
+            weighted = value
+        out[i] = weighted
+    return out
+
+def _rolling_std_loop(values, window):
+    # Welford add/remove updates, sample (ddof=1) standard deviation like pandas. The running
+    # mean and sum of squares are recomputed exactly once per window so rounding error cannot
+    # build up over long series; that adds O(1) amortised work per bar. NaNs never enter the
+    # running sums, count tracks the real values in the window and a window holding a NaN is NaN
+    out = np.full(len(values), np.nan)
+    if window < 2:
+        return out
+    count = 0
+    mean = 0.0
+    m2 = 0.0
+    for i in range(len(values)):
+        value = values[i]
+        if i >= window and (i + 1) % window == 0:
+            count = 0
+            mean = 0.0
+            for j in range(i - window + 1, i + 1):
+                if values[j] == values[j]:
+                    count += 1
+                    mean += values[j]
+            mean = mean / count if count else 0.0
+            m2 = 0.0
+            for j in range(i - window + 1, i + 1):
+                if values[j] == values[j]:
+                    m2 += (values[j] - mean) ** 2
+        else:
+            if i >= window:
+                old = values[i - window]
+                if old == old:
+                    count -= 1
+                    if count == 0:
+                        mean = 0.0
+                        m2 = 0.0
+                    else:
+                        delta = old - mean
+                        mean -= delta / count
+                        m2 -= delta * (old - mean)
+            if value == value:
+                count += 1
+                delta = value - mean
+                mean += delta / count
+                m2 += delta * (value - mean)
+        if count == window:
+            out[i] = np.sqrt(max(m2, 0.0) / (window - 1))
+    return out
+
+def _ewm_pandas(values, alpha):
+    # pandas releases disagree on the bar after a gap (3.0 departs from its documented
+    # weights at alpha=0.5), so series with gaps go through the plain loop instead
+    observed = np.flatnonzero(values == values)
+    if len(observed) and observed[-1] - observed[0] + 1 != len(observed):
+        return _ewm_loop(values, alpha)
+    return pd.Series(values).ewm(alpha=alpha, adjust=False).mean().to_numpy(copy=True)
+
+def _rolling_std_pandas(values, window):
+    return pd.Series(values).rolling(window).std().to_numpy(copy=True)
+
+if HAVE_NUMBA:
+    _ewm_kernel = njit(cache=True)(_ewm_loop)
+    _rolling_std_kernel = njit(cache=True)(_rolling_std_loop)
+else:
+    _ewm_kernel = _ewm_pandas
+    _rolling_std_kernel = _rolling_std_pandas
+
+def _as_array(values):
+    return np.ascontiguousarray(values, dtype=np.float64)
+
+def sma(close, window):
+    # NaNs are summed as zero and counted separately, so one only blanks the windows holding it
+    close = _as_array(close)
+    missing = np.isnan(close)
+    csum = np.concatenate(([0.0], np.cumsum(np.where(missing, 0.0, close))))
+    cmissing = np.concatenate(([0], np.cumsum(missing)))
+    out = np.full(len(close), np.nan)
+    if window <= len(close):
+        out[window - 1:] = (csum[window:] - csum[:-window]) / window
+        out[window - 1:][cmissing[window:] > cmissing[:-window]] = np.nan
+    return out
+
+def ema(close, span=None, alpha=None):
+    if alpha is None:
+        alpha = 2 / (span + 1)
+    return _ewm_kernel(_as_array(close), alpha)
+
+def wma(close, window):
+    # Linear weights 1..window (newest heaviest); a single 'valid' convolution
+    close = _as_array(close)
+    out = np.full(len(close), np.nan)
+    if window <= len(close):
+        weights = np.arange(window, 0, -1, dtype=np.float64)
+        out[window - 1:] = np.convolve(close, weights, 'valid') / weights.sum()
+    return out
+
+def rsi(close, period=14):
+    close = _as_array(close)
+    change = np.diff(close, prepend=np.nan)
+    gain = np.where(change > 0, change, 0.0)
+    loss = np.where(change < 0, -change, 0.0)
+    # The first bar and the bars next to a missing close have no change at all, not a zero one
+    gain[np.isnan(change)] = loss[np.isnan(change)] = np.nan
+    # Wilder smoothing is an EMA with alpha = 1 / period
+    average_gain = _ewm_kernel(gain, 1 / period)
+    average_loss = _ewm_kernel(loss, 1 / period)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out = 100 - 100 / (1 + average_gain / average_loss)
+    out[(average_loss == 0) & (average_gain > 0)] = 100.0
+    out[:period] = np.nan
+    return out
+
+def atr(high, low, close, period=14):
+    high, low, close = _as_array(high), _as_array(low), _as_array(close)
+    previous_close = np.concatenate(([np.nan], close[:-1]))
+    true_range = np.fmax(high - low, np.fmax(np.abs(high - previous_close),
+                                             np.abs(low - previous_close)))
+    # fmax only skips the missing previous close; a bar without its own high or low has no range
+    true_range[np.isnan(high) | np.isnan(low)] = np.nan
+    out = _ewm_kernel(true_range, 1 / period)
+    out[:period - 1] = np.nan
+    return out
+
+def bollinger(close, window=20, num_std=2.0):
+    close = _as_array(close)
+    middle = sma(close, window)
+    width = num_std * _rolling_std_kernel(close, window)
+    return {'middle': middle, 'upper': middle + width, 'lower': middle - width}
+
+def macd(close, fast=12, slow=26, signal=9):
+    close = _as_array(close)
+    line = ema(close, span=fast) - ema(close, span=slow)
+    signal_line = ema(line, span=signal)
+    return {'macd': line, 'signal': signal_line, 'histogram': line - signal_line}
+
+# name -> (function, input columns)
+INDICATORS = {
+    'sma': (sma, ('close',)),
+    'ema': (ema, ('close',)),
+    'wma': (wma, ('close',)),
+    'rsi': (rsi, ('close',)),
+    'atr': (atr, ('high', 'low', 'close')),
+    'bollinger': (bollinger, ('close',)),
+    'macd': (macd, ('close',)),
+}
+
+def compute_indicators(columns, specs):
+    # columns: a DataFrame or mapping of raw arrays. specs: {output name: (indicator, params)}
+    # or (indicator, params, field) to pick one line of a multi-line indicator such as
+    # ('macd', {}, 'signal'). Each input column is converted once and each distinct
+    # (indicator, params) pair is computed once, however many outputs refer to it.
+    inputs = {}
+    computed = {}
+    results = {}
+    for output, spec in specs.items():
+        name, params = spec[0], spec[1]
+        if name not in INDICATORS:
+            raise ValueError(f"Unknown indicator '{name}', choose from {sorted(INDICATORS)}")
+        function, needed = INDICATORS[name]
+        key = (name, tuple(sorted(params.items())))
+        if key not in computed:
+            for column in needed:
+                if column not in inputs:
+                    inputs[column] = _as_array(columns[column])
+            computed[key] = function(*(inputs[column] for column in needed), **params)
+        value = computed[key]
+        results[output] = value[spec[2]] if len(spec) > 2 else value
+    return results
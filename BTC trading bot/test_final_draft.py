@@ -0,0 +1,162 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from final_draft import (load_data, moving_average_crossover, backtest_strategy, stream_signals, read_bars,
+                         sweep_parameters, calculate_sharpe_ratio, annualisation_factor, walk_forward,
+                         calculate_trade_statistics, build_trade_ledger, load_panel, portfolio_backtest,
+                         resample_columns, build_timeframe_pyramid)
+
+CSV_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "BTC_2019_2023_1w.csv")
+
+
+@pytest.fixture(scope="function")
+def btc_data():
+    return load_data(CSV_PATH)
+
+
+def run_pipeline(data, short_window, long_window, initial_capital=10000):
+    data = moving_average_crossover(data, short_window, long_window, os.devnull)
+    return backtest_strategy(data, initial_capital=initial_capital)
+
+
+def test_streaming_matches_batch_bit_for_bit(btc_data):
+    batch = run_pipeline(btc_data, 5, 20)
+    streamed = pd.DataFrame(list(stream_signals(read_bars(CSV_PATH), 5, 20)))
+
+    assert len(streamed) == len(batch)
+    for stream_column, batch_column in [("short_ma", "Short_MA"), ("long_ma", "Long_MA"),
+                                        ("daily_return", "Daily_Return"), ("strategy_return", "Strategy_Return"),
+                                        ("strategy_profit", "Strategy_Profit")]:
+        assert np.array_equal(streamed[stream_column].to_numpy(), batch[batch_column].to_numpy(), equal_nan=True), \
+            f"Streamed {stream_column} differs from the batch {batch_column}."
+    assert np.array_equal(streamed["signal"].to_numpy(), batch["Signal"].to_numpy())
+
+
+def test_sweep_matches_single_pair_pipeline(btc_data):
+    periods_per_year = annualisation_factor(btc_data)
+    sweep = sweep_parameters(btc_data, [3, 5, 10], [20, 40], initial_capital=10000)
+    assert len(sweep) == 6
+    for row in sweep.itertuples():
+        data = run_pipeline(btc_data.copy(), row.Short_Window, row.Long_Window)
+        profit = data["Strategy_Profit"].to_numpy()
+        assert np.isclose(row.Sharpe_Ratio, calculate_sharpe_ratio(data, periods_per_year=periods_per_year), rtol=1e-9)
+        assert np.isclose(row.Net_Profit, profit[-1] - 10000, rtol=1e-9)
+        assert np.isclose(row.Max_Drawdown, (np.maximum.accumulate(profit) - profit).max(), rtol=1e-9)
+
+
+def test_walk_forward_independent_of_workers(btc_data):
+    args = (btc_data, range(2, 8), range(8, 30, 4), 80, 20)
+    serial = walk_forward(*args, max_workers=1)
+    parallel = walk_forward(*args, max_workers=2)
+    assert len(serial) > 1
+    pd.testing.assert_frame_equal(serial, parallel)
+
+
+def test_trade_ledger_segments():
+    # The position over bar t is the signal of bar t - 1 : long over bars 2-3 , short over 4-5 , long over 7
+    data = pd.DataFrame({"close": [10.0, 11, 12, 13, 12, 11, 12, 13],
+                         "Signal": [0, 1, 1, -1, -1, 0, 1, 1],
+                         "Strategy_Profit": [100.0, 100, 110, 120, 130, 140, 140, 150]},
+                        index=pd.date_range("2020-01-06", periods=8, freq="W-MON"))
+    ledger = build_trade_ledger(data)
+    assert ledger["Direction"].tolist() == [1, -1, 1]
+    assert ledger["Bars"].tolist() == [2, 2, 1]
+    assert ledger["Entry"].tolist() == list(data.index[[1, 3, 6]])
+    assert ledger["Exit"].tolist() == list(data.index[[3, 5, 7]])
+    assert ledger["PnL"].tolist() == [20.0, 20.0, 10.0]
+
+    stats = calculate_trade_statistics(data)
+    assert (stats["Total Trades"], stats["Long Trades"], stats["Short Trades"]) == (3, 2, 1)
+    assert stats["Net Profit"] == 50.0 and stats["Losing Trades"] == 0
+
+
+def test_trade_ledger_matches_brute_force(btc_data):
+    data = run_pipeline(btc_data, 5, 20)
+    ledger = build_trade_ledger(data)
+
+    signal = data["Signal"].to_numpy()
+    profit = data["Strategy_Profit"].to_numpy()
+    trades, start = [], None
+    for bar in range(1, len(signal) + 1):
+        held = signal[bar - 1] if bar < len(signal) else 0
+        previous = signal[bar - 2] if bar >= 2 else 0
+        if start is not None and (bar == len(signal) or held != previous):
+            trades.append((start, bar, previous, profit[bar - 1] - profit[start - 1]))
+            start = None
+        if bar < len(signal) and held != 0 and start is None:
+            start = bar
+    assert len(trades) == len(ledger) > 0
+    assert ledger["Bars"].tolist() == [end - start for start, end, _, _ in trades]
+    assert ledger["Direction"].tolist() == [direction for _, _, direction, _ in trades]
+    assert np.allclose(ledger["PnL"], [pnl for _, _, _, pnl in trades])
+
+
+def test_portfolio_single_asset_matches_backtest(btc_data):
+    timestamps, symbols, panel = load_panel({"BTC": CSV_PATH})
+    portfolio = portfolio_backtest(timestamps, symbols, panel, 5, 20, weights=[1.0])
+    single = run_pipeline(btc_data, 5, 20)
+    assert np.allclose(portfolio["Strategy_Profit"].to_numpy(), single["Strategy_Profit"].to_numpy(), rtol=1e-9)
+
+
+def test_portfolio_constant_mix_matches_per_bar_rebalancing(btc_data, tmp_path):
+    # A second asset on the same dates: the BTC price path run backwards
+    reversed_path = pd.read_csv(CSV_PATH, index_col=0)
+    price_columns = ["open", "high", "low", "close", "volume"]
+    reversed_path[price_columns] = reversed_path[price_columns].to_numpy()[::-1]
+    reversed_path.to_csv(tmp_path / "REV.csv")
+    weights, cost = {"BTC": 0.6, "REV": 0.3}, 0.001
+    timestamps, symbols, panel = load_panel({"BTC": CSV_PATH, "REV": str(tmp_path / "REV.csv")})
+    portfolio = portfolio_backtest(timestamps, symbols, panel, 5, 20, weights=weights, rebalance=1,
+                                   transaction_cost=cost)
+
+    # Each sleeve grows like its single-asset backtest less the cost of its signal flips , then
+    # the whole book is reset to the target weights at the end of every bar but the last
+    growth = []
+    for symbol, frame in [("BTC", btc_data), ("REV", load_data(str(tmp_path / "REV.csv")))]:
+        data = run_pipeline(frame, 5, 20)
+        position = data["Signal"].shift(1).fillna(0).to_numpy()
+        flips = np.abs(np.diff(position, prepend=0))
+        growth.append(1 + data["Strategy_Return"].to_numpy() - cost * flips)
+    growth = np.column_stack(growth)
+    target = np.array([weights[symbol] for symbol in symbols])
+    value, equity = 10000.0, []
+    for bar in range(len(growth)):
+        sleeves = value * target * growth[bar]
+        value = sleeves.sum() + value * (1 - target.sum())
+        if bar < len(growth) - 1:
+            value -= cost * value * np.abs(target - sleeves / value).sum()
+        equity.append(value)
+    assert np.allclose(portfolio["Strategy_Profit"].to_numpy(), equity, rtol=1e-10)
+
+
+def test_resample_columns_matches_pandas():
+    # Minute bars with gaps, starting on a Thursday so the first week is a partial one
+    rng = np.random.default_rng(3)
+    minutes = np.sort(rng.choice(np.arange(60 * 24 * 30), size=25000, replace=False))
+    timestamps = pd.Timestamp("2021-03-04 05:17").value + minutes * 60 * 10**9
+    close = 50000 + np.cumsum(rng.normal(0, 20, len(minutes)))
+    columns = {"datetime": timestamps, "open": close + rng.normal(0, 5, len(close)),
+               "high": close + 30, "low": close - 30, "close": close, "volume": rng.uniform(0, 3, len(close))}
+    frame = pd.DataFrame({name: values for name, values in columns.items() if name != "datetime"},
+                         index=pd.DatetimeIndex(timestamps.view("datetime64[ns]")))
+    aggregation = {"open": "first", "high": "max", "low": "min", "close": "last", "volume": "sum"}
+
+    for timeframe, rule, origin in [("5m", "5min", "epoch"), ("1h", "1h", "epoch"), ("1d", "24h", "epoch"),
+                                    ("1w", "168h", pd.Timestamp("1970-01-05"))]:
+        bars = resample_columns(columns, timeframe)
+        expected = frame.resample(rule, origin=origin, label="left", closed="left").agg(aggregation).dropna()
+        assert np.array_equal(bars["datetime"], expected.index.asi8), f"{timeframe} buckets differ."
+        for name in ["open", "high", "low", "close"]:
+            assert np.array_equal(bars[name], expected[name].to_numpy()), f"{timeframe} {name} differs."
+        assert np.allclose(bars["volume"], expected["volume"].to_numpy(), rtol=1e-12)
+
+
+def test_finer_timeframe_than_source_raises():
+    with pytest.raises(ValueError, match="too coarse for 1d bars"):
+        load_data(CSV_PATH, timeframe="1d")
+    with pytest.raises(ValueError):
+        build_timeframe_pyramid(CSV_PATH, ["1h", "1w"])
+    with pytest.raises(ValueError, match="Unknown timeframe"):
+        load_data(CSV_PATH, timeframe="2w")
+    assert len(load_data(CSV_PATH, timeframe="1w")) == len(load_data(CSV_PATH))
@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+import pytest
+import indicators
+from indicators import sma, wma, rsi, atr, bollinger, compute_indicators
+
+
+def price_series(length=300, nans=()):
+    values = 30000 + np.cumsum(np.random.default_rng(7).normal(0, 250, length))
+    values[list(nans)] = np.nan
+    return values
+
+
+NAN_CASES = {"clean": (), "leading": range(5), "middle": (150,), "scattered": (3, 40, 41, 199, 299)}
+
+# The plain Python loops are what Numba compiles, so they are checked against the pandas
+# fallbacks whether or not Numba is installed here
+KERNELS = [("loop", indicators._rolling_std_loop, indicators._ewm_loop)]
+if indicators.HAVE_NUMBA:
+    KERNELS.append(("numba", indicators._rolling_std_kernel, indicators._ewm_kernel))
+
+
+def assert_same(actual, expected, rtol=1e-9):
+    assert np.array_equal(np.isnan(actual), np.isnan(expected)), \
+        f"{np.isnan(actual).sum()} NaN outputs against {np.isnan(expected).sum()}."
+    np.testing.assert_allclose(actual, expected, rtol=rtol)
+
+
+@pytest.mark.parametrize("case", NAN_CASES)
+@pytest.mark.parametrize("name, rolling_std, ewm", KERNELS)
+def test_kernels_match_fallbacks(case, name, rolling_std, ewm):
+    values = price_series(nans=NAN_CASES[case])
+    for window in (2, 20, 64):
+        assert_same(rolling_std(values, window), indicators._rolling_std_pandas(values, window))
+    for alpha in (0.5, 0.3, 2 / 13, 1 / 14):
+        assert_same(ewm(values, alpha), indicators._ewm_pandas(values, alpha))
+
+
+@pytest.mark.parametrize("case", NAN_CASES)
+def test_ewm_fallback_follows_pandas_documented_weights(case):
+    values = price_series(nans=NAN_CASES[case])
+    # alpha=0.5 is left out: pandas 3.0 itself departs from its documented weights there
+    for alpha in (0.3, 2 / 13, 1 / 14):
+        assert_same(indicators._ewm_pandas(values, alpha), pd.Series(values).ewm(alpha=alpha, adjust=False).mean().to_numpy())
+
+
+@pytest.mark.parametrize("case", NAN_CASES)
+def test_windowed_indicators_match_pandas(case):
+    values = price_series(nans=NAN_CASES[case])
+    for window in (1, 20, 64):
+        assert_same(sma(values, window), pd.Series(values).rolling(window).mean().to_numpy())
+        weights = np.arange(1, window + 1, dtype=np.float64)
+        expected = pd.Series(values).rolling(window).apply(lambda bars: bars @ weights / weights.sum(), raw=True)
+        assert_same(wma(values, window), expected.to_numpy())
+
+
+def test_bollinger_same_on_both_paths(monkeypatch):
+    values = price_series(nans=NAN_CASES["scattered"])
+    monkeypatch.setattr(indicators, "_rolling_std_kernel", indicators._rolling_std_loop)
+    compiled_path = bollinger(values, 20)
+    monkeypatch.setattr(indicators, "_rolling_std_kernel", indicators._rolling_std_pandas)
+    pandas_path = bollinger(values, 20)
+    for line in ("middle", "upper", "lower"):
+        assert_same(compiled_path[line], pandas_path[line])
+    # Bars 0-22 (warm-up and bar 3), 40-60, 199-218 and 299, nothing else
+    assert np.isnan(pandas_path["upper"]).sum() == 23 + 21 + 20 + 1
+
+
+def test_recursive_indicators_carry_across_missing_bars():
+    close = price_series(nans=(150,))
+    high, low = close + 100, close - 100
+    strength = rsi(close, 14)
+    assert np.isnan(strength[:14]).all() and not np.isnan(strength[14:]).any()
+    # Neither the missing bar nor the one after it has a change of its own
+    assert strength[151] == strength[150] == strength[149]
+
+    high[150] = np.nan
+    true_range = atr(high, low, close, 14)
+    assert not np.isnan(true_range[13:]).any() and true_range[150] == true_range[149]
+
+
+def test_compute_indicators_shares_work():
+    data = pd.DataFrame({"close": price_series()})
+    lines = compute_indicators(data, {"fast": ("ema", {"span": 12}), "again": ("ema", {"span": 12}),
+                                      "signal": ("macd", {}, "signal")})
+    assert lines["fast"] is lines["again"]
+    assert len(lines["signal"]) == len(data)
+    with pytest.raises(ValueError):
+        compute_indicators(data, {"x": ("nope", {})})
@@ -0,0 +1,238 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from unittest import mock
+
+import bcrypt
+import cryptography
+from cryptography.fernet import Fernet
+
+import project
+from project import (VaultSession, init_db, import_accounts, add, update, view, delete, encrypt_passwd,
+                     decrypt_passwd, verify_master_passwd)
+
+# Seeds throwaway vaults in a temporary directory and times the core operations one call at a time , so the
+# percentiles show what a single CLI action costs . Keys and the master password are set in os.environ for the
+# run only : the real .env and Accounts.db are never read or written .
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000]
+BENCH_PASSWORD = "Bench-Master-1!"
+PERCENTILES = [50, 90, 99]
+
+
+def bench_environment():
+    '''process-local keys so nothing falls back to (or appends to) a real .env file'''
+
+    return {'MASTER_KEY': Fernet.generate_key().decode(),
+            'OLD_MASTER_KEYS': "",
+            'BLIND_INDEX_KEY': Fernet.generate_key().decode(),
+            'MASTER_PASSWORD': bcrypt.hashpw(BENCH_PASSWORD.encode(), bcrypt.gensalt(rounds=4)).decode(),
+            'SECRET_PHRASE': bcrypt.hashpw(b"bench", bcrypt.gensalt(rounds=4)).decode(),
+            'BCRYPT_COST': "4",
+            'BREACH_FILTER': "",
+            'IS_TESTING': "True"}
+
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * q / 100), len(ordered) - 1)]
+
+
+def summarise(samples, elapsed=None):
+    elapsed = sum(samples) if elapsed is None else elapsed
+    summary = {'ops': len(samples), 'ops_per_second': len(samples) / elapsed if elapsed else 0.0,
+               'mean': sum(samples) / len(samples)}
+    for q in PERCENTILES:
+        summary[f'p{q}'] = percentile(samples, q)
+    return summary
+
+
+def time_calls(calls):
+    '''runs each zero-argument call once and returns the per-call wall times'''
+
+    samples = []
+    for call in calls:
+        started = time.perf_counter()
+        call()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def seed_vault(db_path, n_accounts, work_dir):
+    source = os.path.join(work_dir, f"seed_{n_accounts}.jsonl")
+    with open(source, "w") as seed_file:
+        for number in range(n_accounts):
+            seed_file.write(json.dumps({"website": f"site{number:07d}.com", "username": "user",
+                                        "password": f"Password{number}!"}) + "\n")
+    init_db(db_path)
+    session = VaultSession(db_path=db_path)
+    started = time.perf_counter()
+    import_accounts(session, source, progress=None)
+    elapsed = time.perf_counter() - started
+    os.remove(source)
+    return session, {'seconds': elapsed, 'accounts_per_second': n_accounts / elapsed}
+
+
+def concurrent_writers(db_path, writers, ops):
+    '''each writer thread has its own session (own connection) and adds ops accounts to the same on-disk file ,
+    so the numbers include sqlite's lock waits ; failures are the "sqlite error" lines printed by add'''
+
+    samples = [[] for _ in range(writers)]
+    barrier = threading.Barrier(writers)
+
+    def writer(index):
+        session = VaultSession(db_path=db_path)
+        barrier.wait()
+        samples[index] = time_calls([lambda number=number: add(session, f"writer{index}-{number}.com", "user", "Password1!")
+                                     for number in range(ops)])
+        session.close()
+
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        threads = [threading.Thread(target=writer, args=(index,)) for index in range(writers)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+    summary = summarise([sample for writer_samples in samples for sample in writer_samples], elapsed)
+    summary['writers'] = writers
+    summary['errors'] = output.getvalue().count("sqlite error")
+    return summary
+
+
+def bench_size(n_accounts, ops, writers, work_dir):
+    db_path = os.path.join(work_dir, f"Accounts_{n_accounts}.db")
+    session, seeding = seed_vault(db_path, n_accounts, work_dir)
+    entry = {'accounts': n_accounts, 'seed': seeding, 'operations': {}}
+    operations = entry['operations']
+    targets = [(number * 7919) % n_accounts for number in range(min(ops, n_accounts))]
+    token = session.encrypt("Password1!")
+
+    with contextlib.redirect_stdout(io.StringIO()), mock.patch("builtins.input", return_value="no"):
+        # encrypt_passwd / decrypt_passwd reload .env and build a cipher per call , the session methods do not
+        operations['encrypt_passwd'] = summarise(time_calls([lambda: encrypt_passwd("Password1!")] * ops))
+        operations['decrypt_passwd'] = summarise(time_calls([lambda: decrypt_passwd(token)] * ops))
+        operations['session_encrypt'] = summarise(time_calls([lambda: session.encrypt("Password1!")] * ops))
+        operations['session_decrypt'] = summarise(time_calls([lambda: session.decrypt(token)] * ops))
+
+        operations['add'] = summarise(time_calls([lambda number=number: add(session, f"new{number}.com", "user", "Password1!")
+                                                  for number in range(ops)]))
+        # a plain connection gets a fresh session per call : .env reads , cipher setup and the migration check
+        conn = session.conn
+        operations['add_plain_connection'] = summarise(time_calls(
+            [lambda number=number: add(conn, f"plain{number}.com", "user", "Password1!") for number in range(ops)]))
+        operations['update'] = summarise(time_calls(
+            [lambda number=number: update(session, f"site{number:07d}.com", "user", f"Password{number}!", "Changed1!")
+             for number in targets]))
+
+        verify_master_passwd(BENCH_PASSWORD, session)
+        operations['view_page'] = summarise(time_calls(
+            [lambda: view(session, BENCH_PASSWORD, page_size=20)] * ops))
+        operations['view_prefix'] = summarise(time_calls(
+            [lambda number=number: view(session, BENCH_PASSWORD, website_prefix=f"site{number:07d}")
+             for number in targets]))
+        started = time.perf_counter()
+        view(session, BENCH_PASSWORD, workers=4)
+        elapsed = time.perf_counter() - started
+        operations['view_all'] = {'seconds': elapsed, 'accounts_per_second': n_accounts / elapsed}
+
+        operations['delete'] = summarise(time_calls(
+            [lambda number=number: delete(session, f"new{number}.com", "user", "Password1!", "yes") for number in range(ops)]))
+    session.close()
+
+    operations['concurrent_add'] = concurrent_writers(db_path, writers, ops)
+    for path in [db_path, db_path + "-wal", db_path + "-shm"]:
+        if os.path.exists(path):
+            os.remove(path)
+    return entry
+
+
+def run_benchmark(sizes, ops=200, writers=4):
+    results = []
+    environment = bench_environment()
+    with tempfile.TemporaryDirectory() as work_dir, mock.patch.dict(os.environ, environment):
+        previous_dir = os.getcwd()
+        os.chdir(work_dir)
+        try:
+            for n_accounts in sizes:
+                entry = bench_size(n_accounts, ops, writers, work_dir)
+                results.append(entry)
+                operations = entry['operations']
+                print(f"{n_accounts:>9} accounts: seeded at {entry['seed']['accounts_per_second']:.0f}/s , "
+                      f"add p50 {operations['add']['p50'] * 1000:.2f} ms , "
+                      f"view_page p50 {operations['view_page']['p50'] * 1000:.2f} ms , "
+                      f"concurrent add {operations['concurrent_add']['ops_per_second']:.0f}/s", file=sys.stderr)
+        finally:
+            os.chdir(previous_dir)
+    return results
+
+
+def environment_info():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ''
+    return {'commit': commit, 'python': platform.python_version(), 'sqlite': project.sqlite3.sqlite_version,
+            'cryptography': cryptography.__version__, 'bcrypt': bcrypt.__version__,
+            'platform': platform.platform(), 'cpu_count': os.cpu_count()}
+
+
+def find_regressions(results, baseline, threshold=0.25, metric='p50'):
+    '''operations whose metric grew by more than threshold (0.25 = 25% slower) against an earlier JSON report'''
+
+    previous = {entry['accounts']: entry for entry in baseline['results']}
+    regressions = []
+    for entry in results:
+        old = previous.get(entry['accounts'])
+        if old is None:
+            continue
+        for name, stats in entry['operations'].items():
+            old_stats = old['operations'].get(name, {})
+            if metric in stats and old_stats.get(metric):
+                ratio = stats[metric] / old_stats[metric]
+                print(f"{entry['accounts']:>9} {name:<22} {ratio:6.2f}x")
+                if ratio > 1 + threshold:
+                    regressions.append({'accounts': entry['accounts'], 'operation': name, 'ratio': ratio})
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark and load-test the password manager core")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help="vault sizes to seed , e.g. --sizes 1000 1000000")
+    parser.add_argument('--ops', type=int, default=200, help="timed calls per operation")
+    parser.add_argument('--writers', type=int, default=4, help="threads in the concurrent add test")
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--baseline', help="earlier JSON report to check for regressions")
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help="allowed slowdown of the p50 latency before failing (0.25 = 25%%)")
+    args = parser.parse_args(argv)
+
+    results = run_benchmark(args.sizes, args.ops, args.writers)
+    with open(args.output, 'w') as output:
+        json.dump({'environment': environment_info(), 'results': results}, output, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = find_regressions(results, json.load(baseline_file), args.threshold)
+        if regressions:
+            for regression in regressions:
+                print(f"REGRESSION : {regression['operation']} at {regression['accounts']} accounts is "
+                      f"{regression['ratio']:.2f}x slower", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
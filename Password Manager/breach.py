@@ -0,0 +1,157 @@
+import binascii
+import hashlib
+import math
+import mmap
+import os
+import struct
+import sys
+from dotenv import load_dotenv
+
+# A blocked Bloom filter over SHA-1 password hashes (the format of the "Pwned Passwords" download : one
+# SHA1HEX:count line per password) . Every hash sets BITS_PER_HASH bits inside a single 512-bit block , so a
+# lookup reads one cache line of the memory-mapped file and never parses or loads the rest of it.
+#
+# layout : 64 byte header (magic , number of blocks , bits per hash) followed by the blocks , each block is
+# read as one little-endian 512-bit integer
+#
+# positions are derived from the first 16 bytes of the SHA-1 digest : the first 8 bytes (big-endian) pick the
+# block and the next 8 give h1 (high half) and h2 (low half , forced odd) for the double hashing
+# position_i = (h1 + i * h2) mod 512
+
+MAGIC = b"PMBLOOM1"
+HEADER = struct.Struct("<8sQI")
+HEADER_SIZE = 64
+BLOCK_BYTES = 64
+BITS_PER_HASH = 8
+
+_filters = {}
+
+
+def _positions(h1, h2, bits_per_hash):
+    mask = 0
+    for i in range(bits_per_hash):
+        mask |= 1 << ((h1 + i * h2) & 511)
+    return mask
+
+
+class BreachFilter:
+    '''a memory-mapped breach filter : opening it only maps the file , each lookup touches one 64 byte block'''
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as filter_file:
+            self.map = mmap.mmap(filter_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.n_blocks, self.bits_per_hash = HEADER.unpack_from(self.map)
+        if magic != MAGIC or len(self.map) != HEADER_SIZE + self.n_blocks * BLOCK_BYTES:
+            self.map.close()
+            raise ValueError(f"{path} is not a breach filter file")
+
+    def contains_sha1(self, digest):
+        '''True if the 20 byte SHA-1 digest is (probably) in the breach list , False if it certainly is not'''
+
+        block = int.from_bytes(digest[:8], "big") % self.n_blocks
+        mixed = int.from_bytes(digest[8:16], "big")
+        mask = _positions(mixed >> 32, (mixed & 0xFFFFFFFF) | 1, self.bits_per_hash)
+        start = HEADER_SIZE + block * BLOCK_BYTES
+        return int.from_bytes(self.map[start:start + BLOCK_BYTES], "little") & mask == mask
+
+    def __contains__(self, pwd):
+        return self.contains_sha1(hashlib.sha1(pwd.encode()).digest())
+
+    def close(self):
+        self.map.close()
+
+
+def load_breach_filter(path=None):
+    '''the filter named by BREACH_FILTER (or path) , mapped once per process , None when there is none'''
+
+    try:
+        if path is None:
+            path = os.getenv('BREACH_FILTER')
+            if not path:
+                load_dotenv()
+                path = os.getenv('BREACH_FILTER')
+        if not path or not os.path.exists(path):
+            return None
+        if path not in _filters:
+            _filters[path] = BreachFilter(path)
+        return _filters[path]
+    except Exception as e:
+        print(f"An error occurred while loading the breach filter : {e}")
+
+
+def build_breach_filter(source, path, expected_items=None, bits_per_key=12, bits_per_hash=BITS_PER_HASH,
+                        chunk_bytes=1 << 24, progress=None):
+    '''compiles a file of SHA-1 hex lines (SHA1HEX or SHA1HEX:count) into a filter file in one streaming pass ,
+    the bit array is a numpy memmap of the output so memory use stays flat however long the list is ;
+    expected_items defaults to an upper bound from the file size , at 12 bits per key roughly 1 in 200 unknown
+    passwords is wrongly reported as breached'''
+
+    import numpy as np
+
+    if expected_items is None:
+        expected_items = max(os.path.getsize(source) // 41, 1)
+    n_blocks = max(math.ceil(expected_items * bits_per_key / (BLOCK_BYTES * 8)), 1)
+
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as filter_file:
+        filter_file.write(HEADER.pack(MAGIC, n_blocks, bits_per_hash).ljust(HEADER_SIZE, b"\0"))
+        filter_file.truncate(HEADER_SIZE + n_blocks * BLOCK_BYTES)
+    words = np.memmap(temp_path, dtype="<u8", mode="r+", offset=HEADER_SIZE, shape=(n_blocks * 8,))
+
+    added = 0
+    with open(source, "rb") as source_file:
+        while True:
+            chunk = source_file.readlines(chunk_bytes)
+            if not chunk:
+                break
+            lines = [line for line in chunk if len(line) >= 40]
+            if not lines:
+                continue
+            digests = np.frombuffer(binascii.unhexlify(b"".join(line[:32] for line in lines)), dtype=">u8")
+            digests = digests.reshape(-1, 2).astype(np.uint64)
+            word_base = (digests[:, 0] % np.uint64(n_blocks)) * np.uint64(8)
+            h1 = digests[:, 1] >> np.uint64(32)
+            h2 = (digests[:, 1] & np.uint64(0xFFFFFFFF)) | np.uint64(1)
+            for i in range(bits_per_hash):
+                position = (h1 + np.uint64(i) * h2) & np.uint64(511)
+                np.bitwise_or.at(words, word_base + (position >> np.uint64(6)),
+                                 np.left_shift(np.uint64(1), position & np.uint64(63)))
+            added += len(lines)
+            if progress:
+                progress(added, "Hashed")
+
+    words.flush()
+    del words
+    os.replace(temp_path, path)
+    _filters.pop(path, None)
+    return added
+
+
+def main(argv=None):
+    '''python breach.py build <pwned-passwords-sha1.txt> <filter file>  |  python breach.py check [<filter file>]'''
+
+    args = sys.argv[1:] if argv is None else argv
+    try:
+        if len(args) == 3 and args[0] == "build":
+            from project import print_progress
+            added = build_breach_filter(args[1], args[2], progress=print_progress)
+            print(file=sys.stderr)
+            print(f"{added} hashes written to {args[2]} , set BREACH_FILTER={args[2]} in .env to use it..")
+        elif args and args[0] == "check":
+            from getpass import getpass
+            breaches = load_breach_filter(args[1] if len(args) > 1 else None)
+            if breaches is None:
+                print("No breach filter found , build one first..")
+            elif getpass("Password : ") in breaches:
+                print("This password appears in a known data breach!")
+            else:
+                print("This password was not found in the breach list..")
+        else:
+            print(main.__doc__)
+    except Exception as e:
+        print(f"An error occurred in the breach check : {e}")
+
+
+if __name__ == "__main__" :
+    main()
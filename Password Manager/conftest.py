@@ -0,0 +1,7 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def blind_index_key(monkeypatch):
+    # Without it the first VaultSession of a test would write a new BLIND_INDEX_KEY into the real .env
+    monkeypatch.setenv("BLIND_INDEX_KEY", "test-blind-index-key")
@@ -0,0 +1,282 @@
+import asyncio
+import json
+import os
+import socket
+import sqlite3
+import sys
+import time
+from getpass import getpass
+from project import VaultSession , VaultLockedError , init_db , load_master_key , verify_master_passwd , tune_for_bulk , UPSERT_ACCOUNT
+
+# The daemon keeps one unlocked VaultSession (cipher + writer connection) and one reader connection open and
+# answers newline-delimited JSON requests on a Unix socket only the owner can open :
+#   {"op": "get", "website": "...", "username": "..."}                        -> {"ok": true, "password": "..."}
+#   {"op": "add", "website": "...", "username": "...", "password": "..."}     -> {"ok": true}
+#   {"op": "update", ..., "old_password": "...", "password": "..."}          -> {"ok": true}
+#   {"op": "delete", "website": "...", "username": "...", "password": "..."} -> {"ok": true}
+#   {"op": "unlock", "master_password": "..."} , {"op": "lock"} , {"op": "status"}
+# failures come back as {"ok": false, "error": "..."}
+
+SOCKET_PATH = os.getenv('VAULT_SOCKET', 'vault.sock')
+
+
+class VaultDaemon:
+    '''serves the vault over a Unix socket : reads go straight to the reader connection , writes are queued and
+    applied by a single writer task that commits everything waiting in the queue at once'''
+
+    def __init__(self, db_path='Accounts.db', socket_path=SOCKET_PATH, idle_timeout=300):
+        self.db_path = db_path
+        self.socket_path = socket_path
+        init_db(db_path)
+        self.session = VaultSession(db_path=db_path, idle_timeout=idle_timeout)
+        tune_for_bulk(self.session.conn)
+        self.reader = sqlite3.connect(db_path)
+        self.writes = None
+        self.server = None
+        self.tasks = []
+
+    async def start(self):
+        '''binds the socket with owner-only permissions and starts the writer and auto-lock tasks'''
+
+        self.writes = asyncio.Queue()
+        if os.path.exists(self.socket_path):
+            if _socket_in_use(self.socket_path):
+                raise RuntimeError(f"A vault daemon is already listening on {self.socket_path}")
+            os.unlink(self.socket_path)
+        # The umask keeps the socket private from the moment it is bound , chmod is only a second guard
+        old_umask = os.umask(0o177)
+        try:
+            self.server = await asyncio.start_unix_server(self.handle, path=self.socket_path)
+        finally:
+            os.umask(old_umask)
+        os.chmod(self.socket_path, 0o600)
+        self.tasks = [asyncio.create_task(self._writer()), asyncio.create_task(self._auto_lock())]
+        return self.server
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self.session.close()
+        self.reader.close()
+
+    async def serve_forever(self):
+        await self.start()
+        try:
+            await self.server.serve_forever()
+        finally:
+            await self.stop()
+
+    async def handle(self, reader, writer):
+        '''one client connection : a request per line , answered in order'''
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    response = await self.dispatch(json.loads(line))
+                except (ValueError, KeyError, TypeError) as e:
+                    response = {"ok": False, "error": f"Bad request : {e}"}
+                except Exception as e:
+                    response = {"ok": False, "error": f"An unexpected error occurred : {e}"}
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def dispatch(self, request):
+        op = request["op"]
+        if op == "status":
+            return {"ok": True, "locked": self.session.is_locked}
+        if op == "lock":
+            self.session.lock()
+            return {"ok": True}
+        if op == "unlock":
+            return await self.unlock(request["master_password"])
+        if self.session.is_locked:
+            return {"ok": False, "error": "Vault is locked"}
+        if op == "get":
+            return self.get(request["website"], request["username"])
+        if op in ("add", "update", "delete"):
+            future = asyncio.get_running_loop().create_future()
+            self.writes.put_nowait((op, request, future))
+            return await future
+        return {"ok": False, "error": f"Unknown op '{op}'"}
+
+    async def unlock(self, master_passwd):
+        # An expired session is locked here , on the thread that owns its connection , and a live one is touched
+        # so it cannot expire (and close the connection) inside the worker thread while bcrypt runs there
+        session = None if self.session.is_locked else self.session
+        if session is not None:
+            session.touch()
+        # bcrypt runs off the event loop so other clients are not stalled while it hashes
+        if not await asyncio.to_thread(verify_master_passwd, master_passwd, session):
+            return {"ok": False, "error": "Incorrect master password"}
+        if self.session.cipher is None:
+            self.session.unlock()
+            tune_for_bulk(self.session.conn)
+        return {"ok": True}
+
+    def get(self, website, user_name):
+        record = self.reader.execute("SELECT password FROM accounts WHERE lookup = ? AND deleted = 0",
+                                     (self.session.lookup(website, user_name),)).fetchone()
+        if record is None:
+            return {"ok": False, "error": "Match not found"}
+        return {"ok": True, "password": self.session.decrypt(record[0])}
+
+    def apply_write(self, op, request):
+        '''runs one queued write on the writer connection without committing'''
+
+        website, user_name = request["website"], request["username"]
+        lookup = self.session.lookup(website, user_name)
+        cursor = self.session.cursor()
+        if op == "add":
+            cursor.execute(UPSERT_ACCOUNT + "WHERE accounts.deleted = 1",
+                           (website, user_name, self.session.encrypt(request["password"]), lookup, time.time()))
+            if not cursor.rowcount:
+                return {"ok": False, "error": "Account already exists"}
+            return {"ok": True}
+
+        record = cursor.execute("SELECT password FROM accounts WHERE lookup = ? AND deleted = 0", (lookup,)).fetchone()
+        if record is None:
+            return {"ok": False, "error": "Match not found"}
+        expected = request["old_password"] if op == "update" else request["password"]
+        if self.session.decrypt(record[0]) != expected:
+            return {"ok": False, "error": "Incorrect password"}
+        if op == "update":
+            cursor.execute("UPDATE accounts SET password = ? , updated_at = ? WHERE lookup = ?",
+                           (self.session.encrypt(request["password"]), time.time(), lookup))
+        else:
+            cursor.execute("UPDATE accounts SET deleted = 1 , password = '' , updated_at = ? WHERE lookup = ?",
+                           (time.time(), lookup))
+        return {"ok": True}
+
+    async def _writer(self):
+        '''the only task that writes : drains whatever is queued , applies it in order and commits once ,
+        so concurrent clients never race on the connection and a burst of writes costs one fsync'''
+
+        while True:
+            batch = [await self.writes.get()]
+            while not self.writes.empty():
+                batch.append(self.writes.get_nowait())
+            results = []
+            for op, request, future in batch:
+                try:
+                    results.append(self.apply_write(op, request))
+                except VaultLockedError:
+                    results.append({"ok": False, "error": "Vault is locked"})
+                except (sqlite3.Error, KeyError) as e:
+                    results.append({"ok": False, "error": str(e)})
+            try:
+                if self.session.conn is not None:
+                    self.session.commit()
+            except sqlite3.Error as e:
+                # Otherwise the failed batch would stay pending and be committed along with the next one
+                self.session.conn.rollback()
+                results = [{"ok": False, "error": str(e)}] * len(batch)
+            for (_, _, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+    async def _auto_lock(self):
+        '''checking is_locked drops the key once the session has been idle for longer than idle_timeout'''
+
+        while True:
+            await asyncio.sleep(min(self.session.idle_timeout, 5))
+            self.session.is_locked
+
+
+def _socket_in_use(socket_path):
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+            probe.connect(socket_path)
+        return True
+    except OSError:
+        return False
+
+
+class VaultClient:
+    '''thin blocking client , keeps one connection open so each request is a single round trip'''
+
+    def __init__(self, socket_path=SOCKET_PATH):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(socket_path)
+        self.stream = self.sock.makefile("rwb")
+
+    def request(self, op, **fields):
+        self.stream.write(json.dumps({"op": op, **fields}).encode() + b"\n")
+        self.stream.flush()
+        line = self.stream.readline()
+        if not line:
+            raise ConnectionError("Vault daemon closed the connection")
+        return json.loads(line)
+
+    def get(self, website, user_name):
+        return self.request("get", website=website, username=user_name)
+
+    def add(self, website, user_name, passwd):
+        return self.request("add", website=website, username=user_name, password=passwd)
+
+    def update(self, website, user_name, old_passwd, new_passwd):
+        return self.request("update", website=website, username=user_name, old_password=old_passwd, password=new_passwd)
+
+    def delete(self, website, user_name, passwd):
+        return self.request("delete", website=website, username=user_name, password=passwd)
+
+    def unlock(self, master_passwd):
+        return self.request("unlock", master_password=master_passwd)
+
+    def close(self):
+        self.stream.close()
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main(argv=None):
+    '''python daemon.py serve  |  python daemon.py get <website> <username>  |  python daemon.py unlock'''
+
+    args = sys.argv[1:] if argv is None else argv
+    try:
+        if not args or args[0] == "serve":
+            load_master_key()
+            ent_master_passwd = getpass("Enter master password : ").strip()
+            if not verify_master_passwd(ent_master_passwd):
+                print("Incorrect master password! , ACCESS DENIED..")
+                return
+            daemon = VaultDaemon()
+            print(f"Vault daemon listening on {daemon.socket_path}..")
+            asyncio.run(daemon.serve_forever())
+        elif args[0] == "get" and len(args) == 3:
+            with VaultClient() as client:
+                response = client.get(args[1], args[2])
+            print(response["password"] if response["ok"] else response["error"])
+        elif args[0] == "unlock":
+            with VaultClient() as client:
+                response = client.unlock(getpass("Enter master password : ").strip())
+            print("Vault unlocked.." if response["ok"] else response["error"])
+        else:
+            print(main.__doc__)
+    except KeyboardInterrupt:
+        print("Vault daemon stopped..")
+    except (ConnectionError, FileNotFoundError):
+        print("Vault daemon is not running , start it with : python daemon.py serve")
+    except Exception as e:
+        print(f"An unexpected error occurred in the daemon : {e}")
+
+
+if __name__ == "__main__" :
+    main()
@@ -1,41 +1,109 @@
 from bcrypt import hashpw, gensalt, checkpw
-from cryptography.fernet import Fernet , InvalidToken
+from cryptography.fernet import Fernet , MultiFernet , InvalidToken
 import os
 import re
 import sqlite3
+import time
 from getpass import getpass
-from dotenv import load_dotenv
+from dotenv import load_dotenv , dotenv_values
+import base64
+import csv
+import hashlib
+import hmac
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from urllib.parse import urlparse
+from breach import load_breach_filter
+
+DEFAULT_BCRYPT_COST = 12
+
+# Insert , or bring back an account that was deleted ; a caller that must not overwrite a live account appends
+# "WHERE accounts.deleted = 1" , then a rowcount of 0 means the account already exists
+UPSERT_ACCOUNT = ("INSERT INTO accounts (website, username, password, lookup, updated_at) VALUES (?, ?, ?, ?, ?) "
+                  "ON CONFLICT(lookup) DO UPDATE SET password = excluded.password , updated_at = excluded.updated_at , "
+                  "deleted = 0 ")
+
 
 def main():
+    session = None
     try:
         init_db()
         load_master_key()
         load_master_passwd()
+        session = VaultSession()
         while True:
-            mode = input("Please choose an option (add,update,view,delete,exit) : ").lower().strip()
+            mode = input("Please choose an option (add,update,view,delete,import,export,sync,rotate,calibrate,audit,exit) : ").lower().strip()
 
             if mode == "exit" :
                 print("You have successfully exited..")
                 break
 
+            if session.is_locked :
+                print("Vault was locked after being idle..")
+                ent_master_passwd = getpass("Enter master password : ").strip()
+                if not verify_master_passwd(ent_master_passwd,session):
+                    print("Incorrect master password! , ACCESS DENIED..")
+                    continue
+                session.unlock()
+
             if mode == "add" :
-                website,user_name,conn = get_details()
+                website,user_name,conn = get_details(session)
                 passwd = get_passwd()
                 add(conn,website,user_name,passwd)
 
             elif mode == "update" :
-                website,user_name,conn = get_details()
+                website,user_name,conn = get_details(session)
                 old_passwd = getpass("Password : ").strip()
                 new_passwd = getpass("New password : ").strip()
                 update(conn,website,user_name,old_passwd,new_passwd)
 
             elif mode == "view" :
-                conn = sqlite3.connect('Accounts.db')
                 ent_master_passwd = getpass("Enter master password : ").strip()
-                view(conn,ent_master_passwd)
+                website_prefix = input("Website starts with (leave empty for all) : ").strip()
+                user_prefix = input("Username starts with (leave empty for all) : ").strip()
+                view(session,ent_master_passwd,website_prefix,user_prefix,page_size=20)
+
+            elif mode == "import" :
+                path = input("File to import (.csv / .json / .jsonl) : ").strip()
+                import_accounts(session,path)
+
+            elif mode == "export" :
+                ent_master_passwd = getpass("Enter master password : ").strip()
+                if verify_master_passwd(ent_master_passwd,session):
+                    path = input("Export to (.csv / .json / .jsonl) : ").strip()
+                    export_accounts(session,path)
+                else:
+                    print("Incorrect master password! , ACCESS DENIED..")
+
+            elif mode == "sync" :
+                path = input("Other vault to sync with (path to its Accounts.db) : ").strip()
+                if os.path.exists(path) or input(f"There is no vault at {path} , create a new one there ? (yes/no) : ").lower().strip() == "yes":
+                    sync_vaults(session,path,create=True)
+
+            elif mode == "rotate" :
+                ent_master_passwd = getpass("Enter master password : ").strip()
+                if verify_master_passwd(ent_master_passwd,session):
+                    rotate_master_key(session)
+                else:
+                    print("Incorrect master password! , ACCESS DENIED..")
+
+            elif mode == "audit" :
+                ent_master_passwd = getpass("Enter master password : ").strip()
+                if verify_master_passwd(ent_master_passwd,session):
+                    audit_passwords(session)
+                else:
+                    print("Incorrect master password! , ACCESS DENIED..")
+
+            elif mode == "calibrate" :
+                target = input("Target unlock time in milliseconds (default 250) : ").strip()
+                while target and not (target.isdigit() and int(target) > 0):
+                    target = input("Please enter a whole number of milliseconds (or nothing for 250) : ").strip()
+                calibrate_bcrypt_cost(int(target) / 1000 if target else 0.25)
 
             elif mode == "delete" :
-                website,user_name,conn = get_details()
+                website,user_name,conn = get_details(session)
                 passwd = getpass("Password : ").strip()
                 consent = input("Are you sure you wan't to delete this account? (yes/no)").lower().strip()
                 delete(conn,website,user_name,passwd,consent)
@@ -43,26 +111,107 @@ def main():
                 print("Chosen mode doesn't exist..")
     except Exception as e:
         print(f"An unexpected error occurred in main : {e}")
+    finally:
+        if session is not None:
+            session.close()
 
 
-def init_db():
+def init_db(db_path='Accounts.db'):
     '''Setting up the database'''
 
     try:
-        conn = sqlite3.connect('Accounts.db')
+        conn = sqlite3.connect(db_path)
         cursor = conn.cursor()
         cursor.execute('''CREATE TABLE IF NOT EXISTS accounts (
                             id INTEGER PRIMARY KEY,
                             username TEXT NOT NULL,
                             password TEXT NOT NULL,
-                            website TEXT NOT NULL)''')
+                            website TEXT NOT NULL,
+                            lookup TEXT,
+                            updated_at REAL NOT NULL DEFAULT 0,
+                            deleted INTEGER NOT NULL DEFAULT 0,
+                            version INTEGER NOT NULL DEFAULT 0)''')
         conn.commit()
+        migrate_db(conn)
         conn.close()
     except sqlite3.Error as e:
         print(f"sqlite error : {e}")
     except Exception as e:
         print(f"An unexpected error occured in init_db : {e}")
 
+
+def migrate_db(conn, index_key=None, batch_size=1000):
+    '''brings an existing accounts table up to date : adds the blind-index and change-tracking columns , removes
+    duplicate (website, username) rows (the newest one is kept) , creates the indexes and triggers and backfills the
+    blind index in batches so a large Accounts.db is never locked for the whole run'''
+
+    index_key = index_key or load_blind_index_key()
+    cursor = conn.cursor()
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(accounts)")]
+    if "lookup" not in columns:
+        cursor.execute("ALTER TABLE accounts ADD COLUMN lookup TEXT")
+    if "updated_at" not in columns:
+        cursor.execute("ALTER TABLE accounts ADD COLUMN updated_at REAL NOT NULL DEFAULT 0")
+        cursor.execute("ALTER TABLE accounts ADD COLUMN deleted INTEGER NOT NULL DEFAULT 0")
+        cursor.execute("ALTER TABLE accounts ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+        # Rows from before the migration need a version past every sync watermark (which start at 0) or
+        # they would never be sent
+        cursor.execute("UPDATE accounts SET version = id")
+
+    indexes = [row[0] for row in cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'accounts'")]
+    if "idx_accounts_website_username" not in indexes:
+        # Older duplicates may still hold a password that works somewhere , so they are kept in
+        # accounts_duplicates instead of being thrown away
+        cursor.execute("""CREATE TABLE IF NOT EXISTS accounts_duplicates (
+                            id INTEGER PRIMARY KEY,
+                            username TEXT NOT NULL,
+                            password TEXT NOT NULL,
+                            website TEXT NOT NULL,
+                            removed_at REAL NOT NULL)""")
+        duplicates = "FROM accounts WHERE id NOT IN (SELECT MAX(id) FROM accounts GROUP BY website, username)"
+        cursor.execute(f"INSERT OR REPLACE INTO accounts_duplicates (id, username, password, website, removed_at) "
+                       f"SELECT id, username, password, website, ? {duplicates}", (time.time(),))
+        moved = cursor.rowcount
+        cursor.execute(f"DELETE {duplicates}")
+        cursor.execute("CREATE UNIQUE INDEX idx_accounts_website_username ON accounts (website, username)")
+        if moved > 0:
+            print(f"{moved} duplicate accounts (same website and username) were moved to the accounts_duplicates table , "
+                  "the newest one of each was kept..")
+    if "idx_accounts_lookup" not in indexes:
+        cursor.execute("CREATE UNIQUE INDEX idx_accounts_lookup ON accounts (lookup)")
+    if "idx_accounts_version" not in indexes:
+        cursor.execute("CREATE INDEX idx_accounts_version ON accounts (version)")
+    if "idx_accounts_updated_at" not in indexes:
+        # Lets a key rotation find the rows written while it ran without scanning the table
+        cursor.execute("CREATE INDEX idx_accounts_updated_at ON accounts (updated_at)")
+    # version is this vault's own change counter (sync watermarks compare it , updated_at only settles conflicts) ,
+    # every insert and every change of updated_at or deleted moves the row past all earlier changes
+    for name, event in [("accounts_version_insert", "INSERT"), ("accounts_version_update", "UPDATE OF updated_at, deleted")]:
+        cursor.execute(f"""CREATE TRIGGER IF NOT EXISTS {name} AFTER {event} ON accounts BEGIN
+                            UPDATE accounts SET version = (SELECT MAX(version) FROM accounts) + 1 WHERE id = NEW.id;
+                        END""")
+    conn.commit()
+
+    backfilled = 0
+    while True:
+        cursor.execute("SELECT id, website, username FROM accounts WHERE lookup IS NULL LIMIT ?", (batch_size,))
+        rows = cursor.fetchall()
+        if not rows:
+            break
+        cursor.executemany("UPDATE accounts SET lookup = ? WHERE id = ?",
+                        [(blind_index(index_key, website, user_name), row_id) for row_id, website, user_name in rows])
+        conn.commit()
+        backfilled += len(rows)
+    return backfilled
+
+
+def blind_index(index_key, website, user_name):
+    '''keyed HMAC of (website, username) : an exact-match lookup key that reveals nothing about the values ,
+    so rows can be found through a b-tree probe even if website and username are stored encrypted'''
+
+    message = f"{website}\0{user_name}".encode()
+    return hmac.new(index_key.encode(), message, hashlib.sha256).hexdigest()
+
 # Creates a master key used for encrypting and decrypting passwords and stores the master key in .env file only one time..
 def load_master_key():
     '''loading the master key (which will be used for encrypting passwords)'''
@@ -87,6 +236,83 @@ def load_master_key():
         print(f"An error occured while loading master key : {e}")
 
 
+def load_master_keys():
+    '''the current master key followed by the retired ones still listed in OLD_MASTER_KEYS ,
+    the old keys stay readable until a key rotation has re-encrypted every row'''
+
+    master_key = load_master_key()
+    if not master_key:
+        return []
+    old_keys = os.getenv('OLD_MASTER_KEYS') or ""
+    return [master_key] + [key for key in old_keys.split(",") if key]
+
+
+def load_cipher(keys=None):
+    '''a MultiFernet that encrypts with the current master key and decrypts with any of the keys'''
+
+    return MultiFernet([Fernet(key) for key in keys or load_master_keys()])
+
+
+def set_env_value(name, value):
+    '''rewrites (or appends) one NAME=value line of .env and the running environment ,
+    load_dotenv never overrides a variable that is already set so os.environ is updated by hand'''
+
+    lines = []
+    mode = 0o600
+    if os.path.exists(".env"):
+        with open(".env") as env_file:
+            lines = env_file.readlines()
+        mode = os.stat(".env").st_mode & 0o777
+    lines = [line for line in lines if not line.startswith(f"{name}=")]
+    if lines and not lines[-1].endswith("\n"):
+        lines[-1] += "\n"
+    lines.append(f"{name}={value}\n")
+    # Written to a temporary file and swapped in , so a crash can never leave .env half written (and lose the key)
+    descriptor = os.open(".env.tmp", os.O_WRONLY | os.O_CREAT | os.O_TRUNC, mode)
+    with open(descriptor, "w") as env_file:
+        env_file.writelines(lines)
+        env_file.flush()
+        os.fsync(env_file.fileno())
+    os.replace(".env.tmp", ".env")
+    os.environ[name] = value
+
+
+def env_mtime():
+    try:
+        return os.stat(".env").st_mtime_ns
+    except OSError:
+        return None
+
+
+def reload_master_keys():
+    '''re-reads MASTER_KEY and OLD_MASTER_KEYS from .env : load_dotenv never replaces a value the process already has ,
+    so without this a key rotation run by another process would go unnoticed'''
+
+    values = dotenv_values(".env") if os.path.exists(".env") else {}
+    for name in ('MASTER_KEY', 'OLD_MASTER_KEYS'):
+        if values.get(name) is not None:
+            os.environ[name] = values[name]
+    return load_master_keys()
+
+
+def load_blind_index_key():
+    '''loading the key for blind-index lookups , created once and kept in .env next to the master key'''
+
+    try:
+        index_key = os.getenv('BLIND_INDEX_KEY')
+        if not index_key:
+            load_dotenv()
+            index_key = os.getenv('BLIND_INDEX_KEY')
+        if not index_key:
+            index_key = base64.urlsafe_b64encode(os.urandom(32)).decode()
+            with open(".env", "a") as env_file:
+                env_file.write(f"\nBLIND_INDEX_KEY={index_key}\n")
+            os.environ['BLIND_INDEX_KEY'] = index_key
+        return index_key
+    except Exception as e:
+        print(f"An error occured while loading blind index key : {e}")
+
+
 def load_master_passwd():
     '''Creates a master password which user sets , so that in future if user wants to view accounts present he must enter master password..'''
 
@@ -99,8 +325,8 @@ def load_master_passwd():
 
     # Master password and secret phrase don't need to be retrieved thus its safer to hash them..
     # Hashing or encryption requires encoding (normal string --> byte string) then later be decoded while writing it to a file (byte string --> normal string)
-            hashed_pwd = hashpw(pwd.encode() , gensalt())
-            hashed_secret = hashpw(secret.encode() , gensalt())
+            hashed_pwd = hashpw(pwd.encode() , gensalt(rounds=bcrypt_cost()))
+            hashed_secret = hashpw(secret.encode() , gensalt(rounds=bcrypt_cost()))
             with open(".env", "a") as env_file:
                 env_file.write(f"MASTER_PASSWORD={hashed_pwd.decode()}\n")
                 env_file.write(f"SECRET_PHRASE={hashed_secret.decode()}\n ")
@@ -113,12 +339,68 @@ def load_master_passwd():
         print(f"An error occured while loading master password : {e}")
 
 
+def bcrypt_cost():
+    '''the bcrypt cost factor new hashes are made with , BCRYPT_COST is written by the calibrate command'''
+
+    cost = os.getenv('BCRYPT_COST')
+    if not cost:
+        load_dotenv()
+        cost = os.getenv('BCRYPT_COST')
+    return int(cost) if cost else DEFAULT_BCRYPT_COST
+
+
+def hash_cost(hashed):
+    '''the cost factor a bcrypt hash was made with , bcrypt stores it in the hash itself ($2b$<cost>$...)'''
+
+    return int(hashed.split("$")[2])
+
+
+def calibrate_bcrypt_cost(target_seconds=0.25, min_cost=10, max_cost=16):
+    '''times checkpw on this machine and stores in .env the highest cost that still unlocks within target_seconds ,
+    each step of the cost doubles the work so one measurement at min_cost is enough to extrapolate'''
+
+    try:
+        hashed = hashpw(b"calibration", gensalt(rounds=min_cost))
+        timings = []
+        for _ in range(3):
+            started = time.perf_counter()
+            checkpw(b"calibration", hashed)
+            timings.append(time.perf_counter() - started)
+        cost = min_cost
+        while cost < max_cost and min(timings) * 2 ** (cost + 1 - min_cost) <= target_seconds:
+            cost += 1
+        set_env_value('BCRYPT_COST', str(cost))
+        estimate = min(timings) * 2 ** (cost - min_cost)
+        print(f"bcrypt cost set to {cost} (about {estimate * 1000:.0f} ms per unlock) , "
+              "the master password is rehashed on the next unlock..")
+        return cost
+    except Exception as e:
+        print(f"An error occurred while calibrating bcrypt : {e}")
+
+
+def verify_master_passwd(ent_master_passwd, session=None):
+    '''checks the entered master password , a session that has already verified it skips bcrypt entirely and
+    a successful check rehashes the stored hash when it was made with a different cost than BCRYPT_COST'''
+
+    master_passwd = load_master_passwd()[0].strip()
+    if session is not None and session.is_verified(master_passwd, ent_master_passwd):
+        return True
+    if not checkpw(ent_master_passwd.encode(), master_passwd.encode()):
+        return False
+    cost = bcrypt_cost()
+    if hash_cost(master_passwd) != cost:
+        master_passwd = hashpw(ent_master_passwd.encode(), gensalt(rounds=cost)).decode()
+        set_env_value('MASTER_PASSWORD', master_passwd)
+    if session is not None:
+        session.remember_verified(master_passwd, ent_master_passwd)
+    return True
+
+
 def encrypt_passwd(pwd):
     '''encrypts passwords'''
 
     try:
-        master_key = load_master_key()
-        f = Fernet(master_key)
+        f = load_cipher()
         return f.encrypt(pwd.encode()).decode()
     except Exception as e:
         print(f"An error occurred while encrypting the password : {e}")
@@ -128,22 +410,141 @@ def decrypt_passwd(pwd):
     '''decrypts passwords'''
 
     try:
-        master_key = load_master_key()
-        f = Fernet(master_key)
-        return f.decrypt(pwd.encode()).decode()
+        try:
+            return load_cipher().decrypt(pwd.encode()).decode()
+        except InvalidToken:
+            # The key may have been rotated by another process since .env was loaded
+            return load_cipher(reload_master_keys()).decrypt(pwd.encode()).decode()
     except InvalidToken as e:
         print(f"Decryption failed : Invalid token")
     except Exception as e:
         print(f"An error occured while decrypting the password : {e}")
 
 
-def get_details():
-    '''gets user details'''
+class VaultLockedError(Exception):
+    '''raised when a locked or expired vault session is used'''
+
+
+class VaultSession:
+    '''An unlocked vault : the master keys are read once , one MultiFernet cipher and one sqlite connection are kept open
+    and everything is dropped again after idle_timeout seconds without use'''
+
+    def __init__(self, conn=None, db_path='Accounts.db', idle_timeout=300):
+        self.db_path = db_path
+        self.idle_timeout = idle_timeout
+        self.owns_conn = conn is None
+        self.conn = conn
+        self.cipher = None
+        self.last_used = 0
+        self.verify_key = os.urandom(32)
+        self.verified = None
+        self.unlock()
+
+    def unlock(self):
+        '''loads the master key (one .env read) and opens the connection if the session owns it'''
+
+        keys = load_master_keys()
+        if not keys:
+            raise VaultLockedError("Master key could not be loaded")
+        self.cipher = load_cipher(keys)
+        self.env_mtime = env_mtime()
+        self.index_key = load_blind_index_key()
+        if self.conn is None:
+            self.conn = sqlite3.connect(self.db_path)
+        migrate_db(self.conn, self.index_key)
+        self.last_used = time.monotonic()
+
+    def lock(self):
+        '''forgets the key material and closes the connection the session opened'''
+
+        self.cipher = None
+        self.index_key = None
+        self.verified = None
+        if self.owns_conn and self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    close = lock
+
+    @property
+    def is_locked(self):
+        if self.cipher is not None and time.monotonic() - self.last_used > self.idle_timeout:
+            self.lock()
+        return self.cipher is None
+
+    def touch(self):
+        '''marks the session as used , refusing if it has already expired'''
+
+        if self.is_locked:
+            raise VaultLockedError("Vault session is locked , unlock it again")
+        self.last_used = time.monotonic()
+
+    def _verify_digest(self, master_passwd, ent_master_passwd):
+        message = f"{master_passwd}\0{ent_master_passwd}".encode()
+        return hmac.new(self.verify_key, message, hashlib.sha256).digest()
+
+    def remember_verified(self, master_passwd, ent_master_passwd):
+        '''caches a successful unlock as a keyed digest (never the password itself) , tied to the stored hash
+        so changing the master password invalidates it'''
+
+        self.verified = self._verify_digest(master_passwd, ent_master_passwd)
+
+    def is_verified(self, master_passwd, ent_master_passwd):
+        if self.is_locked or self.verified is None:
+            return False
+        return hmac.compare_digest(self.verified, self._verify_digest(master_passwd, ent_master_passwd))
+
+    def cursor(self):
+        self.touch()
+        return self.conn.cursor()
+
+    def commit(self):
+        self.conn.commit()
+
+    def lookup(self, website, user_name):
+        self.touch()
+        return blind_index(self.index_key, website, user_name)
+
+    def reload_keys(self):
+        '''picks up keys changed by a rotation , in this process or another one'''
+
+        self.env_mtime = env_mtime()
+        self.cipher = load_cipher(reload_master_keys())
+
+    def encrypt(self, pwd):
+        self.touch()
+        # A changed .env may mean a rotation has started , new passwords must use the new key
+        if env_mtime() != self.env_mtime:
+            self.reload_keys()
+        return self.cipher.encrypt(pwd.encode()).decode()
+
+    def decrypt(self, pwd):
+        self.touch()
+        try:
+            try:
+                return self.cipher.decrypt(pwd.encode()).decode()
+            except InvalidToken:
+                self.reload_keys()
+                return self.cipher.decrypt(pwd.encode()).decode()
+        except InvalidToken:
+            print("Decryption failed : Invalid token")
+
+
+def get_session(conn):
+    '''add / update / view / delete accept either a VaultSession or a plain sqlite connection ,
+    a plain connection gets a short-lived session so the key is still read only once per call'''
+
+    return conn if isinstance(conn, VaultSession) else VaultSession(conn=conn)
+
+
+def get_details(conn=None):
+    '''gets user details , reusing the given connection / vault session if there is one'''
 
     try:
         website = input("Website name : ").strip()
         user_name = input("Username : ").strip()
-        conn = sqlite3.connect('Accounts.db')
+        if conn is None:
+            conn = sqlite3.connect('Accounts.db')
         return [website,user_name,conn]
     except Exception as e:
         print(f"An error occurred while getting details : {e}")
@@ -153,6 +554,7 @@ def get_passwd():
     '''checks for password strength and accepts the password only if it is strong enough ( i.e pass all the criteria below)'''
 
     try:
+        breaches = load_breach_filter()
         while True:
             pwd = getpass("Password : ").strip()
             if len(pwd) < 8:
@@ -170,6 +572,9 @@ def get_passwd():
             elif not re.search(r'[@$!_%*?&]', pwd):
                 print("Password must contain at least one special character (@$!_%*?&).")
 
+            elif breaches is not None and pwd in breaches:
+                print("This password appears in a known data breach , choose another one.")
+
             else:
                 print("Password is strong!")
                 return pwd
@@ -189,7 +594,7 @@ def update_master_passwd():
 
         if checkpw(entered_secret_phrase.encode(), secret.strip().encode()):
             new_master_pwd = getpass("Update your master password : ")
-            new_hashed_master_pwd = hashpw(new_master_pwd.encode() , gensalt())
+            new_hashed_master_pwd = hashpw(new_master_pwd.encode() , gensalt(rounds=bcrypt_cost()))
 
             for i in range(len(lines)):
                 if lines[i].startswith(f"MASTER_PASSWORD="):
@@ -212,14 +617,20 @@ def add(conn,website,user_name,passwd):
     '''adds new account to the databse'''
 
     try:
-        encrypted_password = encrypt_passwd(passwd)
-        cursor = conn.cursor()
-        cursor.execute("INSERT INTO accounts (website, password, username) VALUES (?, ?, ?)",
-                    (website, encrypted_password, user_name))
-        conn.commit()
-        if os.getenv("IS_TESTING") != "True":
+        session = get_session(conn)
+        encrypted_password = session.encrypt(passwd)
+        cursor = session.cursor()
+        cursor.execute(UPSERT_ACCOUNT + "WHERE accounts.deleted = 1",
+                    (website, user_name, encrypted_password, session.lookup(website, user_name), time.time()))
+        session.commit()
+        if session is not conn and os.getenv("IS_TESTING") != "True":
             conn.close()
-        print("Account added successfully!")
+        if cursor.rowcount:
+            print("Account added successfully!")
+        else:
+            print("An account with this website and username already exists , use update instead..")
+    except sqlite3.IntegrityError:
+        print("An account with this website and username already exists , use update instead..")
     except sqlite3.Error as e:
         print(f"sqlite error : {e}")
     except Exception as e:
@@ -229,16 +640,18 @@ def update(conn,website,user_name,old_passwd,new_passwd):
     '''updates password of an existing account'''
 
     try:
-        encrypted_new_password = encrypt_passwd(new_passwd)
-        cursor = conn.cursor()
-        cursor.execute("SELECT password FROM accounts WHERE username = ? AND website = ?" , (user_name, website))
+        session = get_session(conn)
+        encrypted_new_password = session.encrypt(new_passwd)
+        cursor = session.cursor()
+        lookup = session.lookup(website, user_name)
+        cursor.execute("SELECT password FROM accounts WHERE lookup = ? AND deleted = 0" , (lookup,))
         record = cursor.fetchone()
 
         if record:
-            if decrypt_passwd(record[0]) == old_passwd:
-                cursor.execute("UPDATE accounts SET password = ? WHERE username = ? AND website = ?",
-                            (encrypted_new_password, user_name, website))
-                conn.commit()
+            if session.decrypt(record[0]) == old_passwd:
+                cursor.execute("UPDATE accounts SET password = ? , updated_at = ? WHERE lookup = ?",
+                            (encrypted_new_password, time.time(), lookup))
+                session.commit()
                 print("Password updated successfully!")
             else:
                 print("Incorrect pasword..")
@@ -250,20 +663,67 @@ def update(conn,website,user_name,old_passwd,new_passwd):
         print(f"An error occurred while updating password : {e}")
 
 
-def view(conn,ent_master_passwd):
-    '''views the existing accounts and passwords only if the correct master password is entered'''
+def _prefix_end(prefix):
+    '''smallest string greater than every string starting with prefix , so a prefix becomes an index range'''
+
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def iter_account_pages(conn, website_prefix="", user_prefix="", page_size=500):
+    '''yields pages of (website, username, encrypted password) in (website, username) order using keyset
+    pagination on the unique index , so every page costs the same however large the vault is'''
+
+    filters, params = ["deleted = 0"], []
+    if website_prefix:
+        filters.append("website >= ? AND website < ?")
+        params += [website_prefix, _prefix_end(website_prefix)]
+    if user_prefix:
+        filters.append("username >= ? AND username < ?")
+        params += [user_prefix, _prefix_end(user_prefix)]
+
+    last = None
+    while True:
+        conditions = filters + (["(website, username) > (?, ?)"] if last else [])
+        where = f"WHERE {' AND '.join(conditions)} "
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT website, username, password FROM accounts {where}ORDER BY website, username LIMIT ?",
+                    params + (list(last) if last else []) + [page_size])
+        page = cursor.fetchall()
+        if not page:
+            return
+        yield page
+        if len(page) < page_size:
+            return
+        last = page[-1][:2]
+
+
+def view(conn,ent_master_passwd,website_prefix="",user_prefix="",page_size=None,workers=None):
+    '''views the existing accounts and passwords only if the correct master password is entered ,
+    optionally filtered by website / username prefix ; rows are fetched a page at a time and decrypted only
+    when they are printed , with page_size set the user is asked before each further page and with workers
+    set each page is decrypted on a thread pool (useful for full dumps)'''
 
     try:
-        master_passwd = load_master_passwd()[0]   # Since load_master_passwd is a tuple , its 1st element is master_passwd
-        #if ent_master_passwd == master_passwd :
-        if checkpw(ent_master_passwd.encode(), master_passwd.strip().encode()):
-            cursor = conn.cursor()
-            cursor.execute("SELECT website, username, password FROM accounts")
-            records = cursor.fetchall()
-            conn.close()
-            print("----YOUR STORED ACCOUNTS----")
-            for website, user_name, encrypted_passwd in records:
-                print(f"Website : {website} , Username : {user_name} , Password : {decrypt_passwd(encrypted_passwd)}")
+        session = get_session(conn)
+        if verify_master_passwd(ent_master_passwd, session):
+            pool = ThreadPoolExecutor(max_workers=workers) if workers else None
+            try:
+                print("----YOUR STORED ACCOUNTS----")
+                for page in iter_account_pages(session, website_prefix, user_prefix, page_size or 500):
+                    if pool:
+                        passwords = _map_chunks(pool, session.decrypt, [record[2] for record in page], workers)
+                    else:
+                        passwords = (session.decrypt(record[2]) for record in page)
+                    for (website, user_name, _), passwd in zip(page, passwords):
+                        print(f"Website : {website} , Username : {user_name} , Password : {passwd}")
+                    if page_size and len(page) == page_size:
+                        if input("Show more accounts ? (yes/no) ").strip().lower() != "yes":
+                            break
+            finally:
+                if pool:
+                    pool.shutdown()
+                if session is not conn:
+                    conn.close()
 
         else:
             print("Incorrect master password! , ACCESS DENIED..")
@@ -279,18 +739,47 @@ def view(conn,ent_master_passwd):
         print(f"An error occurred while viewing existing accounts : {e}")
 
 
+def audit_passwords(conn, breaches=None, page_size=500):
+    '''checks every stored password against the breach filter in one streaming pass and
+    returns the (website, username) pairs whose password has been breached'''
+
+    try:
+        breaches = breaches or load_breach_filter()
+        if breaches is None:
+            print("No breach filter found , set BREACH_FILTER in .env to the file built with breach.py..")
+            return
+        session = get_session(conn)
+        breached = []
+        for page in iter_account_pages(session, page_size=page_size):
+            for website, user_name, token in page:
+                if session.decrypt(token) in breaches:
+                    breached.append((website, user_name))
+                    print(f"Breached password : Website : {website} , Username : {user_name}")
+        print(f"{len(breached)} breached passwords found , update them as soon as possible.." if breached
+              else "None of the stored passwords were found in the breach list!")
+        return breached
+    except sqlite3.Error as e:
+        print(f"sqlite error : {e}")
+    except Exception as e:
+        print(f"An error occurred while auditing passwords : {e}")
+
+
 def delete(conn,website,user_name,passwd,consent):
     '''deletes a particular account'''
 
     try:
-        cursor = conn.cursor()
-        cursor.execute("SELECT password FROM accounts WHERE username = ? AND website = ?" , (user_name, website))
+        session = get_session(conn)
+        cursor = session.cursor()
+        lookup = session.lookup(website, user_name)
+        cursor.execute("SELECT password FROM accounts WHERE lookup = ? AND deleted = 0" , (lookup,))
         records = cursor.fetchone()
         if records:
-            if decrypt_passwd(records[0]) == passwd:
+            if session.decrypt(records[0]) == passwd:
                 if consent == "yes" :
-                    cursor.execute("DELETE FROM accounts WHERE username = ? AND website = ?" , (user_name, website))
-                    conn.commit()
+                    # The row stays behind as a tombstone (without the password) so the delete reaches synced vaults
+                    cursor.execute("UPDATE accounts SET deleted = 1 , password = '' , updated_at = ? WHERE lookup = ?" ,
+                                (time.time(), lookup))
+                    session.commit()
                     print("Account deleted successfully!")
             else:
                 print("Incorrect password..")
@@ -302,5 +791,382 @@ def delete(conn,website,user_name,passwd,consent):
         print(f"An error occurred while deleting the account : {e}")
 
 
+def _site_from_url(url):
+    '''example.com from https://example.com/login , plain names are returned unchanged'''
+
+    return urlparse(url).netloc or url if "://" in url else url
+
+
+def _normalise_entry(entry):
+    '''maps a browser / password-manager export row to (website, username, password)'''
+
+    if isinstance(entry.get("login"), dict):   # Bitwarden json items
+        login = entry["login"]
+        uris = login.get("uris") or [{}]
+        website = _site_from_url(uris[0].get("uri") or "") or entry.get("name") or ""
+        return website, login.get("username") or "", login.get("password") or ""
+
+    website = entry.get("website") or entry.get("name") or ""
+    if not website:
+        website = _site_from_url(entry.get("url") or entry.get("login_uri") or "")
+    user_name = entry.get("username") or entry.get("login_username") or ""
+    passwd = entry.get("password") or entry.get("login_password") or ""
+    return website, user_name, passwd
+
+
+def _iter_json_array(json_file, chunk_size=1 << 16):
+    '''yields the items of a top level json array one at a time without loading the whole file'''
+
+    decoder = json.JSONDecoder()
+    buffer = json_file.read(chunk_size).lstrip()[1:]
+    eof = False
+    while True:
+        buffer = buffer.lstrip().lstrip(",").lstrip()
+        while not buffer and not eof:
+            chunk = json_file.read(chunk_size)
+            eof = not chunk
+            buffer = (buffer + chunk).lstrip().lstrip(",").lstrip()
+        if not buffer or buffer[0] == "]":
+            return
+        try:
+            item, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            chunk = json_file.read(chunk_size)
+            if not chunk:
+                raise
+            buffer += chunk
+            continue
+        yield item
+        buffer = buffer[end:]
+
+
+def read_import_file(path):
+    '''streams (website, username, password) tuples from a csv (Chrome , Firefox , Bitwarden or our own export) ,
+    a json array , a Bitwarden json export or json lines file ; rows without a password are skipped'''
+
+    with open(path, newline="", encoding="utf-8-sig") as import_file:
+        if path.lower().endswith(".csv"):
+            entries = csv.DictReader(import_file)
+        elif path.lower().endswith(".jsonl"):
+            entries = (json.loads(line) for line in import_file if line.strip())
+        else:
+            first = import_file.read(1)
+            while first.isspace():
+                first = import_file.read(1)
+            if first == "[":
+                import_file.seek(0)
+                entries = _iter_json_array(import_file)
+            else:
+                import_file.seek(0)
+                entries = json.load(import_file).get("items", [])   # Bitwarden exports are a single object
+
+        for entry in entries:
+            website, user_name, passwd = _normalise_entry(entry)
+            if website and passwd:
+                yield website.strip(), user_name.strip(), passwd
+
+
+def _batches(rows, batch_size):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def _map_chunks(pool, func, values, workers):
+    '''runs func over values on the pool in one task per worker , per-row tasks would cost more than the crypto'''
+
+    size = max(1, -(-len(values) // workers))
+    chunks = [values[i:i + size] for i in range(0, len(values), size)]
+    return [result for chunk in pool.map(lambda chunk: [func(value) for value in chunk], chunks) for result in chunk]
+
+
+def print_progress(done, action="Imported"):
+    print(f"\r{action} {done} accounts..", end="", file=sys.stderr, flush=True)
+
+
+def tune_for_bulk(conn):
+    '''WAL lets readers keep going during long writes and synchronous=NORMAL only syncs at checkpoints'''
+
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+
+
+def import_accounts(conn, path, batch_size=5000, workers=4, overwrite=True, progress=print_progress):
+    '''bulk imports accounts : rows are streamed from the file , encrypted on a thread pool and written with
+    executemany , one transaction per batch ; existing (website, username) pairs get the imported password
+    unless overwrite is False'''
+
+    try:
+        session = get_session(conn)
+        tune_for_bulk(session.conn)
+        query = UPSERT_ACCOUNT if overwrite else UPSERT_ACCOUNT + "WHERE accounts.deleted = 1"
+
+        imported = 0
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for batch in _batches(read_import_file(path), batch_size):
+                tokens = _map_chunks(pool, session.encrypt, [passwd for _, _, passwd in batch], workers)
+                cursor = session.cursor()
+                updated_at = time.time()
+                cursor.executemany(query, [(website, user_name, token, session.lookup(website, user_name), updated_at)
+                                           for (website, user_name, _), token in zip(batch, tokens)])
+                session.commit()
+                imported += len(batch)
+                if progress:
+                    progress(imported)
+        if progress:
+            print(file=sys.stderr)
+        print(f"{imported} accounts imported successfully!")
+        return imported
+    except sqlite3.Error as e:
+        print(f"sqlite error : {e}")
+    except Exception as e:
+        print(f"An error occurred while importing accounts : {e}")
+
+
+def export_accounts(conn, path, batch_size=5000, workers=4, progress=print_progress):
+    '''streams every account (decrypted) to a csv , json or json lines file that import_accounts can read back ;
+    the file is created readable by the owner only'''
+
+    try:
+        session = get_session(conn)
+        cursor = session.cursor()
+        cursor.execute("SELECT website, username, password FROM accounts WHERE deleted = 0 ORDER BY id")
+        fmt = "csv" if path.lower().endswith(".csv") else "jsonl" if path.lower().endswith(".jsonl") else "json"
+
+        exported = 0
+        failed = []
+        descriptor = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with open(descriptor, "w", newline="", encoding="utf-8") as export_file, \
+                ThreadPoolExecutor(max_workers=workers) as pool:
+            writer = csv.writer(export_file)
+            if fmt == "csv":
+                writer.writerow(["website", "username", "password"])
+            elif fmt == "json":
+                export_file.write("[")
+            while True:
+                records = cursor.fetchmany(batch_size)
+                if not records:
+                    break
+                passwords = _map_chunks(pool, session.decrypt, [record[2] for record in records], workers)
+                for (website, user_name, _), passwd in zip(records, passwords):
+                    # A backup must never hold an empty password in place of the real one
+                    if passwd is None:
+                        failed.append((website, user_name))
+                        continue
+                    if fmt == "csv":
+                        writer.writerow([website, user_name, passwd])
+                    else:
+                        line = json.dumps({"website": website, "username": user_name, "password": passwd})
+                        if fmt == "json":
+                            export_file.write(("," if exported else "") + "\n" + line)
+                        else:
+                            export_file.write(line + "\n")
+                    exported += 1
+                if progress:
+                    progress(exported, "Exported")
+            if fmt == "json":
+                export_file.write("\n]\n")
+        if progress:
+            print(file=sys.stderr)
+        print(f"{exported} accounts exported successfully!")
+        if failed:
+            print(f"WARNING : {len(failed)} accounts could not be decrypted and are NOT in {path} :")
+            for website, user_name in failed:
+                print(f"  {user_name} on {website}")
+        return exported
+    except sqlite3.Error as e:
+        print(f"sqlite error : {e}")
+    except Exception as e:
+        print(f"An error occurred while exporting accounts : {e}")
+
+
+def _decrypts(cipher, token):
+    try:
+        cipher.decrypt(token.encode())
+        return True
+    except InvalidToken:
+        return False
+
+
+def _rotate_stale(cursor, cipher, stale):
+    '''re-encrypts rows the new key could not read , unless they changed again since they were read'''
+
+    cursor.executemany(ROTATE_PASSWORD + " AND password = ?",
+                       [(cipher.rotate(token.encode()).decode(), row_id, token) for row_id, token in stale])
+
+
+# A rotated row must reach synced vaults and beat their copy under the old key , but it is not a newer change
+# than an edit made there , so updated_at only moves by a microsecond (which still fires the version trigger)
+ROTATE_PASSWORD = "UPDATE accounts SET password = ? , updated_at = updated_at + 0.000001 WHERE id = ?"
+
+
+def rotate_master_key(conn, batch_size=500, progress=print_progress):
+    '''re-encrypts every password under a fresh master key : the old key moves to OLD_MASTER_KEYS so reads keep
+    working meanwhile , rows are rewritten in id order one short BEGIN IMMEDIATE transaction per batch and the last
+    finished id is checkpointed in rotation_state , so an interrupted rotation resumes where it stopped and other
+    writers never wait longer than one batch ; other sessions switch keys when they see .env change , and before the
+    old keys are retired every row written since the rotation began is checked and re-encrypted if it still needs them ;
+    with synced vaults , sync them before rotating and copy the new MASTER_KEY to the other machines' .env'''
+
+    try:
+        session = get_session(conn)
+        cursor = session.cursor()
+        cursor.execute("CREATE TABLE IF NOT EXISTS rotation_state (id INTEGER PRIMARY KEY CHECK (id = 1), "
+                       "last_id INTEGER NOT NULL, started_at REAL NOT NULL)")
+        # A rotation interrupted before started_at existed resumes with 0 , so the final check covers every row
+        if "started_at" not in [column[1] for column in cursor.execute("PRAGMA table_info(rotation_state)")]:
+            cursor.execute("ALTER TABLE rotation_state ADD COLUMN started_at REAL NOT NULL DEFAULT 0")
+        session.commit()
+        state = cursor.execute("SELECT last_id, started_at FROM rotation_state WHERE id = 1").fetchone()
+        if state is None:
+            # New writes switch to the new key straight away , the old one stays in the list for decrypting
+            started_at = time.time()
+            set_env_value('OLD_MASTER_KEYS', ",".join(reload_master_keys()))
+            set_env_value('MASTER_KEY', Fernet.generate_key().decode())
+            cursor.execute("INSERT INTO rotation_state (id, last_id, started_at) VALUES (1, 0, ?)", (started_at,))
+            session.commit()
+            last_id = 0
+        else:
+            last_id, started_at = state
+            print(f"Resuming key rotation after account id {last_id}..")
+        session.reload_keys()
+
+        rotated = 0
+        while True:
+            with session.conn:
+                cursor = session.cursor()
+                cursor.execute("BEGIN IMMEDIATE")
+                cursor.execute("SELECT id, password FROM accounts WHERE id > ? ORDER BY id LIMIT ?", (last_id, batch_size))
+                rows = cursor.fetchall()
+                if rows:
+                    live = [(row_id, token) for row_id, token in rows if token]
+                    cursor.executemany(ROTATE_PASSWORD,
+                                    [(session.cipher.rotate(token.encode()).decode(), row_id) for row_id, token in live])
+                    last_id = rows[-1][0]
+                    cursor.execute("UPDATE rotation_state SET last_id = ? WHERE id = 1", (last_id,))
+            if not rows:
+                break
+            rotated += len(rows)
+            if progress:
+                progress(rotated, "Rotated")
+
+        # A session that had not yet noticed the new key may have written with an old one behind the checkpoint ;
+        # those rows carry an updated_at from after the start (a minute of slack covers writes already under way) .
+        # They are checked in batches without the write lock , each pass only looking at rows changed since the
+        # previous one , until what is left fits in one batch and can be settled in a last short transaction
+        primary = Fernet(load_master_keys()[0])
+        # (+version keeps sqlite on the updated_at index , the version range of the first pass is the whole table)
+        recent = "FROM accounts WHERE updated_at >= ? AND +version > ? AND deleted = 0 AND password != ''"
+        checked_version = 0
+        while True:
+            with session.conn:
+                cursor = session.cursor()
+                cursor.execute("BEGIN IMMEDIATE")
+                top_version = cursor.execute("SELECT COALESCE(MAX(version), 0) FROM accounts").fetchone()[0]
+                cursor.execute(f"SELECT id, password {recent} LIMIT ?", (started_at - 60, checked_version, batch_size + 1))
+                rows = cursor.fetchall()
+                if len(rows) <= batch_size:
+                    _rotate_stale(cursor, session.cipher, [row for row in rows if not _decrypts(primary, row[1])])
+                    cursor.execute("DELETE FROM rotation_state WHERE id = 1")
+                    break
+            last_seen = (started_at - 60, -1)
+            while True:
+                cursor = session.cursor()
+                cursor.execute("SELECT id, password, updated_at FROM accounts WHERE (updated_at, id) > (?, ?) AND +version > ? "
+                               "AND +version <= ? AND deleted = 0 AND password != '' ORDER BY updated_at, id LIMIT ?",
+                               (*last_seen, checked_version, top_version, batch_size))
+                rows = cursor.fetchall()
+                if not rows:
+                    break
+                last_seen = (rows[-1][2], rows[-1][0])
+                stale = [(row_id, token) for row_id, token, _ in rows if not _decrypts(primary, token)]
+                if stale:
+                    with session.conn:
+                        cursor.execute("BEGIN IMMEDIATE")
+                        _rotate_stale(cursor, session.cipher, stale)
+            checked_version = top_version
+
+        # Every row now decrypts with the new key , the old keys can be retired
+        set_env_value('OLD_MASTER_KEYS', "")
+        session.reload_keys()
+        if progress:
+            print(file=sys.stderr)
+        print(f"Master key rotated , {rotated} passwords re-encrypted!")
+        return rotated
+    except InvalidToken:
+        print("Key rotation stopped : a password could not be decrypted with any known master key")
+    except sqlite3.Error as e:
+        print(f"sqlite error : {e}")
+    except Exception as e:
+        print(f"An error occurred while rotating the master key : {e}")
+
+
+def sync_vaults(conn, peer_path, create=False):
+    '''merges this vault with another Accounts.db (made with the same .env keys) in both directions : only rows
+    whose version is past the watermarks kept in sync_state are exchanged , conflicts on (website, username) go to
+    the newer updated_at (ties to the larger ciphertext so both vaults agree) and all of it is one transaction ;
+    a missing peer file is only created when create is True'''
+
+    try:
+        session = get_session(conn)
+        peer_path = os.path.abspath(peer_path)
+        if not create and not os.path.exists(peer_path):
+            print(f"No vault found at {peer_path}..")
+            return
+        init_db(peer_path)   # creates an empty vault or brings an older one up to the current schema
+
+        cursor = session.cursor()
+        cursor.execute("CREATE TABLE IF NOT EXISTS sync_state (peer TEXT PRIMARY KEY, local_version INTEGER NOT NULL, peer_version INTEGER NOT NULL)")
+        session.commit()
+        cursor.execute("ATTACH DATABASE ? AS peer", (peer_path,))
+        try:
+            with session.conn:
+                cursor.execute("BEGIN IMMEDIATE")
+                state = cursor.execute("SELECT local_version, peer_version FROM sync_state WHERE peer = ?", (peer_path,)).fetchone()
+                local_mark, peer_mark = state or (0, 0)
+                peer_top = cursor.execute("SELECT COALESCE(MAX(version), 0) FROM peer.accounts").fetchone()[0]
+                if peer_top < peer_mark:
+                    # The other file was replaced or restored from a backup , compare everything again
+                    local_mark = peer_mark = 0
+
+                # Only rows about to be pulled are sampled : older ones were checked by an earlier sync , and after
+                # a key rotation here they are still under the retired key until the push below replaces them
+                sample = cursor.execute("SELECT website, username, password, lookup FROM peer.accounts "
+                                        "WHERE deleted = 0 AND version > ? LIMIT 1", (peer_mark,)).fetchone()
+                if sample and session.decrypt(sample[2]) is None:
+                    print("The other vault was made with a different master key , copy its .env keys first..")
+                    return
+                # lookup is copied as it is , so both vaults must also share BLIND_INDEX_KEY or the synced rows
+                # could never be found (or would collide with the same account) here
+                if sample and sample[3] != session.lookup(sample[0], sample[1]):
+                    print("The other vault was made with a different BLIND_INDEX_KEY , copy its .env keys first..")
+                    return
+
+                merge = ("INSERT INTO {target}.accounts (website, username, password, lookup, updated_at, deleted) "
+                         "SELECT website, username, password, lookup, updated_at, deleted FROM {source}.accounts "
+                         "WHERE version > ? AND version <= ? "
+                         "ON CONFLICT(lookup) DO UPDATE SET password = excluded.password , updated_at = excluded.updated_at , "
+                         "deleted = excluded.deleted WHERE excluded.updated_at > accounts.updated_at OR "
+                         "(excluded.updated_at = accounts.updated_at AND excluded.password > accounts.password)")
+                # Rows written by the push get new peer versions above peer_top , so the pull does not read them back
+                local_top = cursor.execute("SELECT COALESCE(MAX(version), 0) FROM main.accounts").fetchone()[0]
+                pushed = cursor.execute(merge.format(target="peer", source="main"), (local_mark, local_top)).rowcount
+                pulled = cursor.execute(merge.format(target="main", source="peer"), (peer_mark, peer_top)).rowcount
+                cursor.execute("INSERT OR REPLACE INTO sync_state (peer, local_version, peer_version) VALUES (?, "
+                               "(SELECT COALESCE(MAX(version), 0) FROM main.accounts), "
+                               "(SELECT COALESCE(MAX(version), 0) FROM peer.accounts))", (peer_path,))
+        finally:
+            cursor.execute("DETACH DATABASE peer")
+        print(f"Sync complete : {pushed} changes sent , {pulled} changes received!")
+        return pushed, pulled
+    except sqlite3.Error as e:
+        print(f"sqlite error : {e}")
+    except Exception as e:
+        print(f"An error occurred while syncing vaults : {e}")
+
+
 if __name__ == "__main__" :
     main()
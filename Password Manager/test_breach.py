@@ -0,0 +1,57 @@
+import hashlib
+import os
+import random
+import sqlite3
+import pytest
+import project
+from breach import build_breach_filter , load_breach_filter , BreachFilter
+from project import add , audit_passwords , get_passwd , VaultSession
+
+
+@pytest.fixture
+def breach_filter(tmp_path):
+    breached = [f"Breached{number}!" for number in range(5000)]
+    source = tmp_path / "pwned.txt"
+    with open(source, "w") as source_file:
+        for pwd in breached:
+            source_file.write(f"{hashlib.sha1(pwd.encode()).hexdigest().upper()}:{random.randint(1, 99)}\r\n")
+    path = str(tmp_path / "breach.filter")
+    assert build_breach_filter(str(source), path, chunk_bytes=4096) == len(breached)
+    return load_breach_filter(path), breached
+
+
+def test_breach_filter_lookup(breach_filter):
+    breaches, breached = breach_filter
+    assert all(pwd in breaches for pwd in breached), "A breached password was missed."
+    false_positives = sum(f"Fresh{number}?" in breaches for number in range(20000))
+    assert false_positives < 200, "Too many false positives."
+
+
+def test_breach_filter_rejects_other_files(tmp_path):
+    path = tmp_path / "not_a_filter"
+    path.write_bytes(b"\0" * 128)
+    with pytest.raises(ValueError):
+        BreachFilter(str(path))
+
+
+def test_get_passwd_rejects_breached(breach_filter, monkeypatch, capsys):
+    breaches, _ = breach_filter
+    monkeypatch.setenv("BREACH_FILTER", breaches.path)
+    answers = iter(["Breached42!", "Unbreached42!"])
+    monkeypatch.setattr(project, "getpass", lambda prompt: next(answers))
+    assert get_passwd() == "Unbreached42!"
+    assert "known data breach" in capsys.readouterr().out
+
+
+def test_audit_passwords(breach_filter, capsys):
+    breaches, _ = breach_filter
+    os.environ["IS_TESTING"] = "True"
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE accounts (id INTEGER PRIMARY KEY, username TEXT NOT NULL, password TEXT NOT NULL, website TEXT NOT NULL)")
+    session = VaultSession(conn=conn)
+    add(session, "example.com", "ann", "Breached7!")
+    add(session, "example.com", "bob", "Unbreached7!")
+    add(session, "other.com", "ann", "Breached4999!")
+    assert audit_passwords(session, breaches, page_size=2) == [("example.com", "ann"), ("other.com", "ann")]
+    assert "2 breached passwords found" in capsys.readouterr().out
+    conn.close()
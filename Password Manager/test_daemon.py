@@ -0,0 +1,122 @@
+import asyncio
+import os
+import sqlite3
+import stat
+import time
+from concurrent.futures import ThreadPoolExecutor
+from daemon import VaultDaemon , VaultClient
+from project import VaultSession
+
+
+def run_with_daemon(tmp_path, client_calls, idle_timeout=300):
+    '''starts a daemon on a throwaway vault and runs the blocking client_calls(socket_path) against it'''
+
+    socket_path = str(tmp_path / "vault.sock")
+
+    async def scenario():
+        daemon = VaultDaemon(str(tmp_path / "Accounts.db"), socket_path, idle_timeout)
+        await daemon.start()
+        try:
+            return await asyncio.to_thread(client_calls, socket_path)
+        finally:
+            await daemon.stop()
+
+    return asyncio.run(scenario())
+
+
+def test_daemon_round_trip(tmp_path):
+    def client_calls(socket_path):
+        assert stat.S_IMODE(os.stat(socket_path).st_mode) == 0o600
+        with VaultClient(socket_path) as client:
+            assert client.add("example.com", "ann", "AnnPassword123!") == {"ok": True}
+            assert client.add("example.com", "ann", "Other123!")["ok"] is False
+            assert client.get("example.com", "ann") == {"ok": True, "password": "AnnPassword123!"}
+            assert client.update("example.com", "ann", "wrong", "NewPassword123!")["error"] == "Incorrect password"
+            assert client.update("example.com", "ann", "AnnPassword123!", "NewPassword123!")["ok"]
+            assert client.get("example.com", "ann")["password"] == "NewPassword123!"
+            assert client.delete("example.com", "ann", "NewPassword123!")["ok"]
+            assert client.get("example.com", "ann") == {"ok": False, "error": "Match not found"}
+            assert client.request("fly")["ok"] is False
+
+            started = time.perf_counter()
+            for _ in range(200):
+                client.get("example.com", "nobody")
+            return (time.perf_counter() - started) / 200
+
+    assert run_with_daemon(tmp_path, client_calls) < 0.005, "Lookups through the daemon are too slow."
+
+
+def test_daemon_concurrent_writers(tmp_path):
+    def writer(socket_path, number):
+        with VaultClient(socket_path) as client:
+            return [client.add(f"site{number}.com", f"user{index}", f"Password{index}!")["ok"] for index in range(25)]
+
+    def client_calls(socket_path):
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(lambda number: writer(socket_path, number), range(8)))
+        with VaultClient(socket_path) as client:
+            assert client.get("site7.com", "user24")["password"] == "Password24!"
+        return results
+
+    assert all(all(result) for result in run_with_daemon(tmp_path, client_calls))
+
+
+def test_daemon_auto_lock(tmp_path):
+    def client_calls(socket_path):
+        with VaultClient(socket_path) as client:
+            assert client.add("example.com", "ann", "AnnPassword123!")["ok"]
+            time.sleep(1.2)
+            assert client.request("status") == {"ok": True, "locked": True}
+            assert client.get("example.com", "ann") == {"ok": False, "error": "Vault is locked"}
+            assert client.unlock("wrong")["ok"] is False
+            assert client.unlock("root123") == {"ok": True}
+            assert client.get("example.com", "ann")["password"] == "AnnPassword123!"
+
+    run_with_daemon(tmp_path, client_calls, idle_timeout=1)
+
+
+def test_daemon_failed_commit_is_rolled_back(tmp_path, monkeypatch):
+    commit = VaultSession.commit
+    failures = [sqlite3.OperationalError("disk I/O error")]
+
+    def failing_commit(session):
+        if failures:
+            raise failures.pop()
+        commit(session)
+    monkeypatch.setattr(VaultSession, "commit", failing_commit)
+
+    def client_calls(socket_path):
+        with VaultClient(socket_path) as client:
+            assert client.add("example.com", "ann", "AnnPassword123!") == {"ok": False, "error": "disk I/O error"}
+            assert client.add("other.com", "ann", "AnnPassword123!") == {"ok": True}
+            assert client.get("example.com", "ann") == {"ok": False, "error": "Match not found"}
+
+    run_with_daemon(tmp_path, client_calls)
+
+
+def test_daemon_unlock_after_idle_timeout(tmp_path):
+    async def scenario():
+        daemon = VaultDaemon(str(tmp_path / "Accounts.db"), str(tmp_path / "vault.sock"))
+        await daemon.start()
+        try:
+            # Expired , but the auto-lock task has not noticed yet
+            daemon.session.last_used -= daemon.session.idle_timeout + 1
+            assert await daemon.unlock("root123") == {"ok": True}
+            assert not daemon.session.is_locked
+        finally:
+            await daemon.stop()
+
+    asyncio.run(scenario())
+
+
+def test_daemon_reports_unexpected_errors(tmp_path, monkeypatch):
+    def broken_get(self, website, user_name):
+        raise RuntimeError("reader connection is gone")
+    monkeypatch.setattr(VaultDaemon, "get", broken_get)
+
+    def client_calls(socket_path):
+        with VaultClient(socket_path) as client:
+            assert client.get("example.com", "ann") == {"ok": False, "error": "An unexpected error occurred : reader connection is gone"}
+            assert client.request("status") == {"ok": True, "locked": False}
+
+    run_with_daemon(tmp_path, client_calls)
@@ -1,7 +1,9 @@
 import os
 import sqlite3
+import time
 import pytest
-from project import add , view , update ,delete , encrypt_passwd , decrypt_passwd 
+import project
+from project import add , view , update ,delete , encrypt_passwd , decrypt_passwd , VaultSession , VaultLockedError , migrate_db , blind_index , import_accounts , export_accounts , read_import_file , iter_account_pages , rotate_master_key , verify_master_passwd , calibrate_bcrypt_cost , hash_cost , sync_vaults , init_db
 
 
 @pytest.fixture(scope="function")
@@ -91,7 +93,372 @@ def test_delete(setup_database):
 
     consent = "yes"
     delete(conn,website,user_name,passwd,consent)
-    cursor.execute("SELECT * FROM accounts WHERE website='example.com' AND username='user123';")
+    cursor.execute("SELECT * FROM accounts WHERE website='example.com' AND username='user123' AND deleted = 0;")
     result = cursor.fetchone()
     assert result is None, "Account was not deleted."
+    cursor.execute("SELECT password FROM accounts WHERE website='example.com' AND username='user123';")
+    assert cursor.fetchone() == ("",), "Deleted account left no tombstone or kept its password."
+    conn.close()
+
+
+def test_vault_session_reads_key_once(setup_database, monkeypatch):
+    loads = []
+    load_master_key = project.load_master_key
+    monkeypatch.setattr(project, "load_master_key", lambda: loads.append(1) or load_master_key())
+    session = VaultSession(conn=setup_database)
+
+    add(session, "example.com", "user123", "TestPassword123!")
+    add(session, "other.com", "user456", "OtherPassword123!")
+    update(session, "example.com", "user123", "TestPassword123!", "NewTestPassword123!")
+    delete(session, "other.com", "user456", "OtherPassword123!", "yes")
+
+    cursor = setup_database.cursor()
+    cursor.execute("SELECT website, password FROM accounts WHERE deleted = 0")
+    records = cursor.fetchall()
+    assert len(loads) == 1, "Master key was reloaded during the session."
+    assert len(records) == 1 and records[0][0] == "example.com"
+    assert session.decrypt(records[0][1]) == "NewTestPassword123!"
+    session.close()
+    setup_database.close()
+
+
+def test_vault_session_idle_timeout(setup_database):
+    session = VaultSession(conn=setup_database, idle_timeout=0.01)
+    token = session.encrypt("TestPassword123!")
+    time.sleep(0.02)
+    assert session.is_locked, "Session did not lock after the idle timeout."
+    with pytest.raises(VaultLockedError):
+        session.decrypt(token)
+    session.unlock()
+    assert session.decrypt(token) == "TestPassword123!"
+    setup_database.close()
+
+
+def test_migrate_db_dedupes_and_backfills(setup_database, capsys):
+    conn = setup_database
+    cursor = conn.cursor()
+    rows = [("example.com", "user123", "old"), ("example.com", "user123", "new")]
+    rows += [(f"site{i}.com", f"user{i}", "pwd") for i in range(5)]
+    cursor.executemany("INSERT INTO accounts (website, username, password) VALUES (?, ?, ?)", rows)
+    conn.commit()
+
+    assert migrate_db(conn, "test-key", batch_size=2) == 6
+    cursor.execute("SELECT password, lookup FROM accounts WHERE website = 'example.com'")
+    assert cursor.fetchall() == [("new", blind_index("test-key", "example.com", "user123"))]
+    cursor.execute("SELECT id, website, username, password FROM accounts_duplicates")
+    assert cursor.fetchall() == [(1, "example.com", "user123", "old")], "The older duplicate was not backed up."
+    assert "1 duplicate accounts" in capsys.readouterr().out
+    cursor.execute("SELECT COUNT(*) FROM accounts WHERE lookup IS NULL")
+    assert cursor.fetchone()[0] == 0
+
+    cursor.execute("EXPLAIN QUERY PLAN SELECT password FROM accounts WHERE lookup = ?", ("x",))
+    assert "idx_accounts_lookup" in " ".join(str(row) for row in cursor.fetchall())
+    with pytest.raises(sqlite3.IntegrityError):
+        cursor.execute("INSERT INTO accounts (website, username, password) VALUES ('example.com', 'user123', 'x')")
+    assert migrate_db(conn, "test-key") == 0
+    conn.close()
+
+
+def test_add_duplicate_account(setup_database, capsys):
+    conn = setup_database
+    add(conn, "example.com", "user123", "TestPassword123!")
+    add(conn, "example.com", "user123", "OtherPassword123!")
+    assert "already exists" in capsys.readouterr().out
+    cursor = conn.cursor()
+    cursor.execute("SELECT password FROM accounts")
+    records = cursor.fetchall()
+    assert len(records) == 1 and decrypt_passwd(records[0][0]) == "TestPassword123!"
+    conn.close()
+
+
+def test_import_export_round_trip(setup_database, tmp_path):
+    conn = setup_database
+    source = tmp_path / "chrome.csv"
+    source.write_text("name,url,username,password,note\n"
+                      "example.com,https://example.com/login,user123,TestPassword123!,\n"
+                      ",https://other.com/,user456,OtherPassword123!,\n"
+                      "empty.com,https://empty.com/,nobody,,\n")
+
+    assert import_accounts(conn, str(source), batch_size=1, progress=None) == 2
+    assert import_accounts(conn, str(source), progress=None) == 2
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*) FROM accounts")
+    assert cursor.fetchone()[0] == 2, "Re-importing created duplicate accounts."
+
+    for name in ["export.csv", "export.json", "export.jsonl"]:
+        target = tmp_path / name
+        assert export_accounts(conn, str(target), batch_size=1, progress=None) == 2
+        assert list(read_import_file(str(target))) == [("example.com", "user123", "TestPassword123!"),
+                                                       ("other.com", "user456", "OtherPassword123!")]
+    conn.close()
+
+
+def test_export_reports_passwords_it_cannot_decrypt(setup_database, tmp_path, capsys):
+    conn = setup_database
+    session = VaultSession(conn=conn)
+    add(session, "example.com", "user123", "TestPassword123!")
+    add(session, "broken.com", "user456", "OtherPassword123!")
+    conn.execute("UPDATE accounts SET password = ? WHERE website = 'broken.com'",
+                 (project.Fernet(project.Fernet.generate_key()).encrypt(b"OtherPassword123!").decode(),))
+    capsys.readouterr()
+
+    for name in ["export.csv", "export.json", "export.jsonl"]:
+        target = tmp_path / name
+        assert export_accounts(session, str(target), progress=None) == 1
+        assert list(read_import_file(str(target))) == [("example.com", "user123", "TestPassword123!")]
+        assert "null" not in target.read_text() and "broken.com" not in target.read_text()
+        output = capsys.readouterr().out
+        assert f"1 accounts could not be decrypted and are NOT in {target}" in output
+        assert "user456 on broken.com" in output
+    conn.close()
+
+
+def test_view_pages_filters_and_decrypts_lazily(setup_database, capsys, monkeypatch):
+    conn = setup_database
+    session = VaultSession(conn=conn)
+    for website in ["alpha.com", "alpine.org", "beta.com"]:
+        for user_name in ["ann", "bob"]:
+            add(session, website, user_name, f"{user_name.title()}Password123!")
+    capsys.readouterr()
+
+    decrypted = []
+    decrypt = session.decrypt
+    monkeypatch.setattr(session, "decrypt", lambda token: decrypted.append(token) or decrypt(token))
+    monkeypatch.setattr("builtins.input", lambda prompt: "no")
+    view(session, "root123", website_prefix="alp", page_size=3)
+    output = capsys.readouterr().out
+    assert output.count("Website : ") == 3 and len(decrypted) == 3, "Rows beyond the first page were decrypted."
+    assert "Website : alpha.com , Username : ann , Password : AnnPassword123!" in output
+
+    view(session, "root123", website_prefix="alp", user_prefix="b", workers=2)
+    output = capsys.readouterr().out
+    assert output.count("Website : ") == 2 and "beta.com" not in output and "ann" not in output
+
+    pages = list(iter_account_pages(session, page_size=4))
+    assert [len(page) for page in pages] == [4, 2]
+    cursor = conn.cursor()
+    cursor.execute("EXPLAIN QUERY PLAN SELECT website, username, password FROM accounts "
+                   "WHERE (website, username) > (?, ?) ORDER BY website, username LIMIT 4", ("a", "b"))
+    assert "TEMP B-TREE" not in " ".join(str(row) for row in cursor.fetchall()), "Pagination sorts instead of using the index."
+    conn.close()
+
+
+def test_rotate_master_key_resumes_after_interrupt(setup_database, tmp_path, monkeypatch, capsys):
+    conn = setup_database
+    monkeypatch.setenv("MASTER_KEY", project.load_master_key())
+    monkeypatch.setenv("OLD_MASTER_KEYS", "")
+    monkeypatch.chdir(tmp_path)
+    session = VaultSession(conn=conn)
+    for number in range(5):
+        add(session, f"site{number}.com", "ann", f"AnnPassword{number}!")
+    old_key = os.environ["MASTER_KEY"]
+
+    def interrupt(done, action):
+        raise KeyboardInterrupt
+    with pytest.raises(KeyboardInterrupt):
+        rotate_master_key(session, batch_size=2, progress=interrupt)
+    new_key = os.environ["MASTER_KEY"]
+    assert new_key != old_key and os.environ["OLD_MASTER_KEYS"] == old_key
+    assert conn.execute("SELECT last_id FROM rotation_state").fetchone()[0] == 2
+    # Rows on either side of the checkpoint stay readable mid-rotation
+    assert decrypt_passwd(conn.execute("SELECT password FROM accounts WHERE id = 5").fetchone()[0]) == "AnnPassword4!"
+
+    assert rotate_master_key(session, batch_size=2, progress=None) == 3
+    assert "Resuming key rotation after account id 2" in capsys.readouterr().out
+    assert os.environ["MASTER_KEY"] == new_key and os.environ["OLD_MASTER_KEYS"] == ""
+    assert conn.execute("SELECT COUNT(*) FROM rotation_state").fetchone()[0] == 0
+    new_cipher = project.Fernet(new_key)
+    for number, (token,) in enumerate(conn.execute("SELECT password FROM accounts ORDER BY id")):
+        assert new_cipher.decrypt(token.encode()).decode() == f"AnnPassword{number}!"
+    assert f"MASTER_KEY={new_key}" in (tmp_path / ".env").read_text()
+    plan = conn.execute("EXPLAIN QUERY PLAN SELECT id FROM accounts WHERE updated_at >= ? AND +version > ?", (0, 0)).fetchall()
+    assert "idx_accounts_updated_at" in str(plan), "Finding recently written rows scans the table."
     conn.close()
+
+
+def test_rotate_master_key_with_other_sessions_open(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    old_key = project.Fernet.generate_key().decode()
+    monkeypatch.setenv("MASTER_KEY", old_key)
+    monkeypatch.setenv("OLD_MASTER_KEYS", "")
+    (tmp_path / ".env").write_text(f"MASTER_KEY={old_key}\n")
+    db_path = str(tmp_path / "Accounts.db")
+    init_db(db_path)
+    rotating = VaultSession(db_path=db_path)
+    other = VaultSession(db_path=db_path)   # stands in for the daemon or a second CLI
+    for number in range(4):
+        add(rotating, f"site{number}.com", "ann", f"AnnPassword{number}!")
+
+    def interrupt(done, action):
+        raise KeyboardInterrupt
+    with pytest.raises(KeyboardInterrupt):
+        rotate_master_key(rotating, batch_size=2, progress=interrupt)
+    # Another process would still have the old key in its environment
+    monkeypatch.setenv("MASTER_KEY", old_key)
+    monkeypatch.setenv("OLD_MASTER_KEYS", "")
+    rotated = other.conn.execute("SELECT password FROM accounts WHERE website = 'site0.com'").fetchone()[0]
+    assert other.decrypt(rotated) == "AnnPassword0!"
+    update(other, "site3.com", "ann", "AnnPassword3!", "Changed3!")
+    # A writer that never noticed the new key , behind the checkpoint
+    other.conn.execute("UPDATE accounts SET password = ? , updated_at = ? WHERE website = 'site1.com'",
+                       (project.Fernet(old_key).encrypt(b"Changed1!").decode(), time.time()))
+    other.conn.commit()
+
+    rotate_master_key(rotating, batch_size=2, progress=None)
+    new_cipher = project.Fernet(os.environ["MASTER_KEY"])
+    passwords = {website: new_cipher.decrypt(token.encode()).decode()
+                 for website, token in other.conn.execute("SELECT website, password FROM accounts")}
+    assert passwords == {"site0.com": "AnnPassword0!", "site1.com": "Changed1!",
+                         "site2.com": "AnnPassword2!", "site3.com": "Changed3!"}
+    assert not (tmp_path / ".env.tmp").exists()
+    rotating.close()
+    other.close()
+
+
+def test_verify_master_passwd_rehashes_and_caches(setup_database, tmp_path, monkeypatch):
+    conn = setup_database
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("MASTER_PASSWORD", project.hashpw(b"root123", project.gensalt(rounds=5)).decode())
+    monkeypatch.setenv("BCRYPT_COST", "4")
+    session = VaultSession(conn=conn)
+
+    checks = []
+    checkpw = project.checkpw
+    monkeypatch.setattr(project, "checkpw", lambda pwd, hashed: checks.append(pwd) or checkpw(pwd, hashed))
+    assert not verify_master_passwd("wrong123", session)
+    assert verify_master_passwd("root123", session)
+    assert hash_cost(os.environ["MASTER_PASSWORD"]) == 4, "Hash was not upgraded to the configured cost."
+    assert "MASTER_PASSWORD=$2b$04$" in (tmp_path / ".env").read_text()
+    assert verify_master_passwd("root123", session) and len(checks) == 2, "Cached unlock still ran bcrypt."
+    assert not verify_master_passwd("wrong123", session)
+
+    session.lock()
+    assert verify_master_passwd("root123", session) and len(checks) == 4, "Locking did not drop the cached unlock."
+    conn.close()
+
+
+def test_calibrate_bcrypt_cost(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("BCRYPT_COST", "")
+    assert calibrate_bcrypt_cost(target_seconds=0, min_cost=4, max_cost=6) == 4
+    assert calibrate_bcrypt_cost(target_seconds=60, min_cost=4, max_cost=6) == 6
+    assert os.environ["BCRYPT_COST"] == "6" and (tmp_path / ".env").read_text() == "BCRYPT_COST=6\n"
+
+
+def test_sync_vaults_exchanges_only_changes(tmp_path, capsys):
+    source = tmp_path / "accounts.jsonl"
+    source.write_text("".join(f'{{"website": "site{number}.com", "username": "ann", "password": "Password{number}!"}}\n'
+                              for number in range(300)))
+    init_db(str(tmp_path / "laptop.db"))
+    laptop = VaultSession(db_path=str(tmp_path / "laptop.db"))
+    import_accounts(laptop, str(source), progress=None)
+
+    assert sync_vaults(laptop, str(tmp_path / "desktop.db")) is None
+    assert not (tmp_path / "desktop.db").exists(), "A mistyped path created a new vault."
+    assert sync_vaults(laptop, str(tmp_path / "desktop.db"), create=True) == (300, 0)
+    assert sync_vaults(laptop, str(tmp_path / "desktop.db")) == (0, 0)
+    desktop = VaultSession(db_path=str(tmp_path / "desktop.db"))
+    versions = {name: dict(session.conn.execute("SELECT website, version FROM accounts"))
+                for name, session in [("laptop", laptop), ("desktop", desktop)]}
+
+    update(laptop, "site1.com", "ann", "Password1!", "LaptopPassword1!")
+    update(desktop, "site1.com", "ann", "Password1!", "DesktopPassword1!")
+    update(desktop, "site2.com", "ann", "Password2!", "DesktopPassword2!")
+    delete(laptop, "site3.com", "ann", "Password3!", "yes")
+    add(laptop, "new.com", "ann", "NewPassword1!")
+    assert sync_vaults(laptop, str(tmp_path / "desktop.db")) == (2, 2)
+    assert sync_vaults(laptop, str(tmp_path / "desktop.db")) == (0, 0)
+    capsys.readouterr()
+
+    rows = {}
+    for name, session in [("laptop", laptop), ("desktop", desktop)]:
+        rows[name] = {website: (deleted, session.decrypt(token) if token else token, version) for website, token, deleted, version
+                      in session.conn.execute("SELECT website, password, deleted, version FROM accounts")}
+        untouched = [website for website in versions[name] if website not in ("site1.com", "site2.com", "site3.com")]
+        assert all(rows[name][website][2] == versions[name][website] for website in untouched), "Unchanged rows were rewritten."
+    for website in ["site1.com", "site2.com", "site3.com", "new.com", "site299.com"]:
+        assert rows["laptop"][website][:2] == rows["desktop"][website][:2]
+    assert rows["desktop"]["site1.com"][:2] == (0, "DesktopPassword1!"), "The newer change did not win."
+    assert rows["desktop"]["site2.com"][:2] == (0, "DesktopPassword2!")
+    assert rows["desktop"]["site3.com"][:2] == (1, ""), "The delete was not synced."
+    assert rows["desktop"]["new.com"][:2] == (0, "NewPassword1!")
+
+    add(desktop, "site3.com", "ann", "RevivedPassword3!")
+    assert sync_vaults(laptop, str(tmp_path / "desktop.db")) == (0, 1)
+    token = laptop.conn.execute("SELECT password FROM accounts WHERE website = 'site3.com' AND deleted = 0").fetchone()[0]
+    assert laptop.decrypt(token) == "RevivedPassword3!", "Re-adding a deleted account did not sync."
+    laptop.close()
+    desktop.close()
+
+
+def test_sync_vaults_sends_rows_from_a_migrated_vault(tmp_path):
+    legacy_path = str(tmp_path / "legacy.db")
+    legacy = sqlite3.connect(legacy_path)
+    legacy.execute("CREATE TABLE accounts (id INTEGER PRIMARY KEY, username TEXT NOT NULL, password TEXT NOT NULL, website TEXT NOT NULL)")
+    legacy.executemany("INSERT INTO accounts (username, password, website) VALUES (?, ?, ?)",
+                       [("ann", encrypt_passwd(f"Password{number}!"), f"site{number}.com") for number in range(3)])
+    legacy.commit()
+    legacy.close()
+
+    init_db(legacy_path)
+    session = VaultSession(db_path=legacy_path)
+    assert sync_vaults(session, str(tmp_path / "peer.db"), create=True) == (3, 0)
+    peer = VaultSession(db_path=str(tmp_path / "peer.db"))
+    assert {website: peer.decrypt(token) for website, token in peer.conn.execute("SELECT website, password FROM accounts")} == \
+        {f"site{number}.com": f"Password{number}!" for number in range(3)}
+    session.close()
+    peer.close()
+
+
+def test_sync_vaults_refuses_a_different_blind_index_key(tmp_path, capsys, monkeypatch):
+    monkeypatch.setenv("BLIND_INDEX_KEY", "desktop-blind-index-key")
+    init_db(str(tmp_path / "desktop.db"))
+    desktop = VaultSession(db_path=str(tmp_path / "desktop.db"))
+    add(desktop, "example.com", "ann", "DesktopPassword1!")
+    monkeypatch.setenv("BLIND_INDEX_KEY", "laptop-blind-index-key")
+    init_db(str(tmp_path / "laptop.db"))
+    laptop = VaultSession(db_path=str(tmp_path / "laptop.db"))
+    add(laptop, "example.com", "ann", "LaptopPassword1!")
+    capsys.readouterr()
+
+    assert sync_vaults(laptop, str(tmp_path / "desktop.db")) is None
+    assert "different BLIND_INDEX_KEY" in capsys.readouterr().out
+    for session in [laptop, desktop]:
+        assert session.conn.execute("SELECT COUNT(*) FROM accounts").fetchone()[0] == 1
+        session.close()
+
+
+def test_sync_vaults_sends_rotated_passwords(tmp_path, capsys, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("MASTER_KEY", project.Fernet.generate_key().decode())
+    monkeypatch.setenv("OLD_MASTER_KEYS", "")
+    init_db(str(tmp_path / "laptop.db"))
+    laptop = VaultSession(db_path=str(tmp_path / "laptop.db"))
+    for number in range(3):
+        add(laptop, f"site{number}.com", "ann", f"Password{number}!")
+    assert sync_vaults(laptop, str(tmp_path / "desktop.db"), create=True) == (3, 0)
+
+    assert rotate_master_key(laptop, progress=None) == 3
+    assert os.environ["OLD_MASTER_KEYS"] == ""
+    assert sync_vaults(laptop, str(tmp_path / "desktop.db")) == (3, 0), "Rotated passwords were not sent."
+    assert sync_vaults(laptop, str(tmp_path / "desktop.db")) == (0, 0)
+    desktop = VaultSession(db_path=str(tmp_path / "desktop.db"))
+    assert {website: desktop.decrypt(token) for website, token in desktop.conn.execute("SELECT website, password FROM accounts")} == \
+        {f"site{number}.com": f"Password{number}!" for number in range(3)}
+    laptop.close()
+    desktop.close()
+
+
+def test_main_calibrate_prompts_again_on_bad_input(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("MASTER_KEY", project.Fernet.generate_key().decode())
+    monkeypatch.setenv("MASTER_PASSWORD", "unused")
+    monkeypatch.setenv("SECRET_PHRASE", "unused")
+    answers = iter(["calibrate", "fast", "-5", "0", "300", "exit"])
+    monkeypatch.setattr("builtins.input", lambda prompt: next(answers))
+    targets = []
+    monkeypatch.setattr(project, "calibrate_bcrypt_cost", targets.append)
+
+    project.main()
+    assert targets == [0.3]
+    assert "You have successfully exited" in capsys.readouterr().out